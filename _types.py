@@ -3,5 +3,6 @@ import numpy as np
 
 Player = int
 Coalition = Set[Player]
+Mask = int
 Value = Union[int, float]
 Payoff = np.ndarray
@@ -0,0 +1,158 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Any, Optional
+
+import numpy as np
+
+from games.boss_game import BossGame
+from games.boss_game_with_unemployment import BossGameWithUnemployment
+from games.cookie_game import CookieGame
+from games.coop_game import CoopGame
+from games.gloves_game import GlovesGame
+from games.pipeline_game import PipelineGame
+from games.shoes_game import ShoesGame
+from graphs.game_graph import GameGraph
+from graphs.leverage_graph import LeverageGraph
+
+# every game family at a given amount of players
+FAMILIES: Dict[str, Callable[[int], CoopGame]] = {
+    'gloves': lambda n: GlovesGame(n, n // 2),
+    'shoes': lambda n: ShoesGame(n, n // 2),
+    'pipeline': lambda n: PipelineGame(*[n // 3 + (i < n % 3) for i in range(3)]),
+    'boss': lambda n: BossGame(n - 1),
+    'boss_unemployment': lambda n: BossGameWithUnemployment(n - 1),
+    'cookie': lambda n: CookieGame(*[(3, 5, 7, 1, 2)[i % 5] for i in range(n)]),
+}
+# the tree without merge_same_coalition holds n! paths
+UNMERGED_PLAYERS = 5
+
+
+def benchmarks(family: str, players: int) -> Dict[str, Callable[[], Callable[[], Any]]]:
+    # every benchmark is a setup returning the timed call, which returns the graph it built or queried if any
+    def fresh() -> CoopGame:
+        # a new game for every run so no characteristic function cache is shared
+        return FAMILIES[family](players)
+
+    def shapely():
+        game = fresh()
+        return lambda: game.shapely_values(game.grand_coalition)
+
+    def build(**kwargs):
+        def setup():
+            game = fresh()
+            return lambda: GameGraph(game, **kwargs)
+        return setup
+
+    def dominance():
+        graph = GameGraph(fresh())
+
+        def call():
+            graph.strictly_dominant_set()
+            return graph
+        return call
+
+    def evaluate():
+        return LeverageGraph(fresh(), leverage_epsilon=0.01).evaluate_leverage
+
+    def stable():
+        graph = LeverageGraph(fresh(), leverage_epsilon=0.01)
+        return lambda: graph.find_stable()[0]
+
+    cases = {
+        'shapely_values': shapely,
+        'build_tree': build(),
+        'build_compact': build(compact=True),
+        'build_parent_average': build(compact=True, parent_average=True),
+        'strictly_dominant_set': dominance,
+        'evaluate_leverage': evaluate,
+        'find_stable': stable,
+    }
+    if players <= UNMERGED_PLAYERS:
+        cases['build_tree_unmerged'] = build(merge_same_coalition=False)
+    return cases
+
+
+def measure(setup: Callable[[], Callable[[], Any]], repeat: int, memory: bool) -> Dict[str, Any]:
+    # best time of repeat runs, then the peak memory of one more run under tracemalloc, which slows it down
+    seconds = np.inf
+    result = None
+    for _ in range(repeat):
+        call = setup()
+        start = time.perf_counter()
+        result = call()
+        seconds = min(seconds, time.perf_counter() - start)
+    measured = {'seconds': seconds}
+    if memory:
+        call = setup()
+        tracemalloc.start()
+        call()
+        measured['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if isinstance(result, GameGraph):
+        measured['nodes'] = len(result.to_set())
+    return measured
+
+
+def run(families: List[str], sizes: List[int], repeat=3, memory=True, only: Optional[List[str]] = None) -> dict:
+    results = []
+    for family in families:
+        for players in sizes:
+            for name, setup in benchmarks(family, players).items():
+                if only and name not in only:
+                    continue
+                result = dict(family=family, players=players, benchmark=name, **measure(setup, repeat, memory))
+                results.append(result)
+                print(f'{family:18} {players:3} {name:22} {result["seconds"]:9.4f}s'
+                      + (f' {result["peak_bytes"] / 2 ** 20:9.2f}MiB' if memory else '')
+                      + (f' {result["nodes"]:7} nodes' if 'nodes' in result else ''))
+    return {'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'machine': platform.machine(), 'platform': platform.platform()},
+            'results': results}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    # prints the time ratio of every benchmark found in both and returns the amount slower than tolerance allows
+    def key(result):
+        return result['family'], result['players'], result['benchmark']
+
+    old = {key(result): result for result in baseline['results']}
+    regressions = 0
+    for result in results['results']:
+        if key(result) not in old:
+            continue
+        ratio = result['seconds'] / max(old[key(result)]['seconds'], 1e-9)
+        slower = ratio > tolerance
+        regressions += slower
+        print(f'{"SLOWER" if slower else "":6} {result["family"]:18} {result["players"]:3} {result["benchmark"]:22} '
+              f'{ratio:6.2f}x')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='time and measure the graph engines over the built-in games')
+    parser.add_argument('--family', nargs='+', choices=sorted(FAMILIES), default=sorted(FAMILIES))
+    parser.add_argument('--players', nargs='+', type=int, default=[3, 4, 5, 6])
+    parser.add_argument('--benchmark', nargs='+', help='run only these benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--out', help='write the results as json')
+    parser.add_argument('--baseline', help='results json of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='slowdown ratio over the baseline reported as a regression')
+    args = parser.parse_args()
+    results = run(args.family, args.players, args.repeat, not args.no_memory, args.benchmark)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            raise SystemExit(f'{regressions} benchmarks are slower than the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,43 @@
-from _types import Coalition, Value, Payoff
+from typing import List, Tuple, Dict, Any
+
+from _types import Coalition, Value, Payoff, Player
 from games.coop_game import CoopGame
+from tools import popcounts
+
+import numpy as np
 
 
 class BossGame(CoopGame):
     def __init__(self, players_amount: int):
         CoopGame.__init__(self, players_amount + 1)
 
+    def parameters(self) -> Tuple[tuple, Dict[str, Any]]:
+        return (self.players_amount - 1,), {}
+
+    def player_types(self) -> List[List[Player]]:
+        # the boss and the workers
+        return [[0], list(range(1, self.players_amount))] if self.players_amount > 1 else [[0]]
+
     def value(self, coalition: Coalition) -> Value:
         if 0 in coalition:
             return len(coalition) - 1
         return 0
 
+    def values(self, masks: np.ndarray) -> np.ndarray:
+        return np.where(masks & 1 == 1, popcounts(masks) - 1, 0).astype(float)
+
+    def shapely_values(self, coalition: Coalition) -> Payoff:
+        # a worker adds 1 exactly when the boss comes before them, which is half of the orderings
+        payoff = np.zeros(self.players_amount)
+        if 0 not in coalition:
+            return payoff
+        workers = sorted(coalition - {0})
+        payoff[workers] = 1 / 2
+        payoff[0] = len(workers) / 2
+        return payoff
+
 
 if __name__ == '__main__':
     game = BossGame(5)
+    print(CoopGame.shapely_values(game, game.grand_coalition))
     print(game.shapely_values(game.grand_coalition))
@@ -1,17 +1,45 @@
-from _types import Coalition, Value, Payoff
+from typing import List, Tuple, Dict, Any
+
+from _types import Coalition, Value, Payoff, Player
 from games.coop_game import CoopGame
+from tools import popcounts
+
+import numpy as np
 
 
 class BossGameWithUnemployment(CoopGame):
     def __init__(self, players_amount: int):
         CoopGame.__init__(self, players_amount + 1)
 
+    def parameters(self) -> Tuple[tuple, Dict[str, Any]]:
+        return (self.players_amount - 1,), {}
+
+    def player_types(self) -> List[List[Player]]:
+        # the boss and the workers
+        return [[0], list(range(1, self.players_amount))] if self.players_amount > 1 else [[0]]
+
     def value(self, coalition: Coalition) -> Value:
         if 0 in coalition:
             return len(coalition) - 1
         return len(coalition) / 8
 
+    def values(self, masks: np.ndarray) -> np.ndarray:
+        sizes = popcounts(masks)
+        return np.where(masks & 1 == 1, sizes - 1, sizes / 8)
+
+    def shapely_values(self, coalition: Coalition) -> Payoff:
+        # a worker adds 1 when the boss comes before them and 1/8 otherwise, without a boss everyone adds 1/8
+        payoff = np.zeros(self.players_amount)
+        workers = sorted(coalition - {0})
+        if 0 not in coalition:
+            payoff[workers] = 1 / 8
+            return payoff
+        payoff[workers] = 9 / 16
+        payoff[0] = len(workers) * 7 / 16
+        return payoff
+
 
 if __name__ == '__main__':
     game = BossGameWithUnemployment(5)
+    print(CoopGame.shapely_values(game, game.grand_coalition))
     print(game.shapely_values(game.grand_coalition))
@@ -1,17 +1,76 @@
-from _types import Coalition, Value, Payoff
+import math
+import operator
+from typing import List, Tuple, Dict, Any
+
+from _types import Coalition, Value, Payoff, Player
 from games.coop_game import CoopGame
+from tools import popcounts
+
+import numpy as np
 
 
 class CookieGame(CoopGame):
     def __init__(self, *args, value_factor=1.1):
         CoopGame.__init__(self, len(args))
-        self.values = args
+        self.cookie_values = args
         self.value_factor = value_factor
 
+    def parameters(self) -> Tuple[tuple, Dict[str, Any]]:
+        return tuple(self.cookie_values), {'value_factor': self.value_factor}
+
+    def player_types(self) -> List[List[Player]]:
+        # players with cookies of the same value are interchangeable
+        types = {}
+        for player, cookie_value in enumerate(self.cookie_values):
+            types.setdefault(cookie_value, []).append(player)
+        return list(types.values())
+
     def value(self, coalition: Coalition) -> Value:
-        return round(sum(self.values[x] for x in coalition) * self.value_factor ** len(coalition))
+        return round(sum(self.cookie_values[x] for x in sorted(coalition)) * self.value_factor ** len(coalition))
+
+    def values(self, masks: np.ndarray) -> np.ndarray:
+        total = np.zeros(len(masks))
+        for player, cookie_value in enumerate(self.cookie_values):
+            total += np.where(masks >> player & 1 == 1, cookie_value, 0)
+        return np.round(total * self.value_factor ** popcounts(masks))
+
+    def shapely_values(self, coalition: Coalition) -> Payoff:
+        """
+        the value only depends on the amount of cookies and their total, so for integer cookie values the subsets
+        of the others are counted per (size, total) with a knapsack style table instead of being enumerated.
+        players with cookies of the same value get the same payoff and share one table. the table is only used
+        while it is smaller than the 2^|coalition| subsets, the counts and the values are integers, so the sums
+        are exact and rounded once, as in CoopGame.shapely_values
+        """
+        players = sorted(coalition)
+        cookies = [self.cookie_values[x] for x in players]
+        size = len(players)
+        total = sum(cookies)
+        if not all(isinstance(c, (int, np.integer)) and c >= 0 for c in cookies) or size * (total + 1) >= 1 << size:
+            return CoopGame.shapely_values(self, coalition)
+        payoff = np.zeros(self.players_amount)
+        # values[s, t] is the value of s cookies worth t together, computed as in values()
+        values = np.round(np.arange(total + 1)[None, :] * self.value_factor ** np.arange(size + 1)[:, None])
+        orderings = [math.factorial(s) * math.factorial(size - s - 1) for s in range(size)]
+        combs = math.factorial(size)
+        for cookie in set(cookies):
+            others = list(cookies)
+            others.remove(cookie)
+            # ways[s, t] is the amount of subsets of the others with s cookies worth t
+            ways = np.zeros((size, total + 1), dtype=np.int64)
+            ways[0, 0] = 1
+            for other in others:
+                ways[1:, other:] += ways[:-1, :total + 1 - other].copy()
+            added = values[1:, cookie:] - values[:-1, :total + 1 - cookie]
+            share = 0
+            for s in range(size):
+                share += orderings[s] * sum(map(operator.mul, ways[s, :total + 1 - cookie].tolist(),
+                                                map(int, added[s].tolist())))
+            payoff[[x for x, c in zip(players, cookies) if c == cookie]] = share / combs
+        return payoff
 
 
 if __name__ == '__main__':
     game = CookieGame(5, 3, 7, 1)
+    print(CoopGame.shapely_values(game, game.grand_coalition))
     print(game.shapely_values(game.grand_coalition))
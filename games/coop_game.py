@@ -1,25 +1,161 @@
 import abc
-from _types import Coalition, Value, Player, Payoff
+from fractions import Fraction
+from statistics import NormalDist
+from typing import Dict, Optional, List, NamedTuple, Tuple, Union, Any
+
+from _types import Coalition, Value, Player, Payoff, Mask
 from sympy.utilities.iterables import multiset_permutations
 import math
 import numpy as np
 
-from tools import normalize_payoff
+import instrumentation
+from tools import normalize_payoff, mask_to_coalition, popcounts, coalition_to_mask, counted_orderings, exact_sum
+
+# games up to this size that override values() can keep the value of every coalition in one array
+VALUE_TABLE_PLAYERS = 24
+# the table is only built for coalitions missing at most this many players, smaller ones cost less on their own
+VALUE_TABLE_MISSING_PLAYERS = 2
+
+Seed = Union[None, int, np.random.Generator]
+
+
+class ShapleyEstimate(NamedTuple):
+    payoff: Payoff  # estimated shapely value of every player, 0 outside the coalition
+    standard_error: Payoff
+    samples: int  # permutations drawn, or subsets drawn per stratum
+
+    def confidence_interval(self, confidence=0.95) -> Tuple[Payoff, Payoff]:
+        # normal approximation, lower and upper bound of every player
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        return self.payoff - z * self.standard_error, self.payoff + z * self.standard_error
 
 
 class CoopGame(abc.ABC):
     def __init__(self, players_amount: int):
         self.grand_coalition = set(range(players_amount))
         self.players_amount = players_amount
+        self._value_cache: Dict[Mask, Value] = {}
+        self._value_table: Optional[np.ndarray] = None
 
     @abc.abstractmethod
     def value(self, coalition: Coalition) -> Value:
         pass
 
+    def cached_value(self, mask: Mask) -> Value:
+        # the characteristic function is evaluated at most once per coalition for the lifetime of the game
+        try:
+            value = self._value_cache[mask]
+            instrumentation.count('value_cache_hits')
+            return value
+        except KeyError:
+            instrumentation.count('value_calls')
+            value = self._value_cache[mask] = self.value(mask_to_coalition(mask))
+            return value
+
+    def values(self, masks: np.ndarray) -> np.ndarray:
+        """
+        the characteristic function of every coalition in an array of bitmasks.
+        games that can evaluate it with bitwise operations override this, the default goes through value()
+        """
+        return np.array([self.cached_value(int(mask)) for mask in masks], dtype=float)
+
+    def _sampled_values(self, masks: np.ndarray) -> np.ndarray:
+        # values() for sampled coalitions, which are rarely drawn twice: games without values() look them up in the
+        # value cache but do not add them to it, which would keep millions of them for the lifetime of the game
+        if type(self).values is not CoopGame.values:
+            return self.values(masks)
+        instrumentation.count('value_calls', len(masks))
+        cache = self._value_cache
+        return np.array([cache[mask] if mask in cache else self.value(mask_to_coalition(mask))
+                         for mask in masks.tolist()], dtype=float)
+
+    def value_table(self) -> Optional[np.ndarray]:
+        # the value of every coalition indexed by bitmask, None for games too big to hold it or without values()
+        if self._value_table is None and self.players_amount <= VALUE_TABLE_PLAYERS and \
+                type(self).values is not CoopGame.values:
+            instrumentation.count('batched_values', 1 << self.players_amount)
+            self._value_table = self.values(np.arange(1 << self.players_amount, dtype=np.int64))
+        return self._value_table
+
+    def parameters(self) -> Optional[Tuple[tuple, Dict[str, Any]]]:
+        # the arguments that construct this game again, used to save graphs. None when they are not known,
+        # graphs of such games are saved without them and the game is given again when they are loaded
+        return None
+
+    def player_types(self) -> Optional[List[List[Player]]]:
+        # groups of interchangeable players: the value of a coalition only depends on how many players of each
+        # group it holds. None when the game declares no such groups
+        return None
+
     def added_value(self, coalition: Coalition, player: Player) -> Value:
         return self.value(coalition | {player}) - self.value(coalition)
 
     def shapely_values(self, coalition: Coalition) -> Payoff:
+        # subset form: phi_p = sum over S without p of |S|! (n - |S| - 1)! (v(S + p) - v(S)) / n!
+        # the added values are summed, weighted and divided exactly and rounded once at the end. for games with
+        # integer values that is exactly what the permutation walk gives, with fractional values the walk rounds
+        # on every step and can differ in the last bits, permutation_shapely_values keeps its output
+        payoffs = np.zeros(self.players_amount)
+        players = sorted(coalition)
+        size = len(players)
+        if size == 0:
+            return payoffs
+        local = np.arange(1 << size, dtype=np.int64)
+        masks = np.zeros_like(local)
+        for bit, p in enumerate(players):
+            masks |= ((local >> bit) & 1) << p
+        table = self._value_table
+        if table is None and size >= self.players_amount - VALUE_TABLE_MISSING_PLAYERS:
+            table = self.value_table()
+        if table is None:
+            instrumentation.count('batched_values', len(masks))
+            values = self.values(masks)
+        else:
+            values = table[masks]
+        # the subsets by increasing size, those without a player hold comb(size - 1, s) subsets of every size s
+        order = local[np.argsort(popcounts(local), kind='stable')]
+        cuts = np.cumsum([math.comb(size - 1, s) for s in range(size - 1)])
+        weights = [math.factorial(s) * math.factorial(size - s - 1) for s in range(size)]
+        combs = math.factorial(size)
+        for bit, p in enumerate(players):
+            without = order[(order >> bit) & 1 == 0]
+            added = np.split(values[without | (1 << bit)] - values[without], cuts)
+            total = sum(exact_sum(group.tolist()) * weight for group, weight in zip(added, weights))
+            payoffs[p] = float(total / combs)
+        return payoffs
+
+    def type_shapely_values(self, coalition: Coalition) -> Payoff:
+        """
+        shapely_values for games that declare player_types. the subsets of the coalition are grouped by the amount
+        of players of every type they hold, so only prod(c_t + 1) coalitions are evaluated instead of 2^|coalition|.
+        the groups are weighted by their exact amount of orderings and rounded once, as in shapely_values
+        """
+        payoffs = np.zeros(self.players_amount)
+        members = [sorted(coalition & set(players)) for players in self.player_types()]
+        members = [players for players in members if players]
+        if not members:
+            return payoffs
+        counts = np.array([len(players) for players in members])
+        strides = np.cumprod(np.concatenate([[1], counts[:-1] + 1]))
+        rows = np.arange(int(np.prod(counts + 1)))
+        sub_counts = rows[:, None] // strides % (counts + 1)
+        masks = np.zeros(len(rows), dtype=np.int64)
+        for t, players in enumerate(members):
+            prefixes = np.array([coalition_to_mask(players[:amount]) for amount in range(len(players) + 1)],
+                                dtype=np.int64)
+            masks |= prefixes[sub_counts[:, t]]
+        instrumentation.count('batched_values', len(masks))
+        values = self.values(masks)
+        combs = math.factorial(int(counts.sum()))
+        for t, players in enumerate(members):
+            without = rows[sub_counts[:, t] < counts[t]]
+            orderings = counted_orderings(counts, sub_counts[without], t)
+            added = (values[without + strides[t]] - values[without]).tolist()
+            total = sum(Fraction(value) * amount for value, amount in zip(added, orderings) if value)
+            payoffs[players] = float(total / combs)
+        return payoffs
+
+    def permutation_shapely_values(self, coalition: Coalition) -> Payoff:
         payoffs = np.zeros(self.players_amount)
         for perm in multiset_permutations(coalition):
             temp_coalition = set()
@@ -29,5 +165,78 @@ class CoopGame(abc.ABC):
         combs = math.factorial(len(coalition))
         return payoffs / combs
 
+    def sampled_shapely_values(self, coalition: Coalition, samples=1000, target_error: Optional[float] = None,
+                               max_samples=100000, seed: Seed = None, stratified=False) -> ShapleyEstimate:
+        """
+        monte carlo estimate of shapely_values for coalitions too big to enumerate.
+        without stratified, random orderings of the coalition are drawn and every player gets its added value to
+        the players before it. with stratified, every player draws the same amount of random subsets of every
+        size from the others and the sizes are averaged, which removes the variance between sizes.
+        samples are drawn in batches of samples (orderings, or subsets per player and size) until the largest
+        standard error is at most target_error or max_samples were drawn, without target_error a single batch
+        """
+        rng = np.random.default_rng(seed)
+        players = np.array(sorted(coalition), dtype=np.int64)
+        size = len(players)
+        payoff = np.zeros(self.players_amount)
+        if size == 0:
+            return ShapleyEstimate(payoff, np.zeros(self.players_amount), 0)
+        empty = self._sampled_values(np.zeros(1, dtype=np.int64))[0]
+        # sums and sums of squares of the sampled added values, per player or per player and size
+        shape = (size, size) if stratified else (size,)
+        total, squares = np.zeros(shape), np.zeros(shape)
+        drawn = 0
+        while True:
+            if stratified:
+                added = self._stratified_added_values(players, samples, empty, rng)
+            else:
+                added = self._permutation_added_values(players, samples, empty, rng)
+            total += added.sum(axis=-1)
+            squares += (added ** 2).sum(axis=-1)
+            drawn += samples
+            mean = total / drawn
+            # variance of the sampled means
+            variance = np.maximum(squares / drawn - mean ** 2, 0) / max(1, drawn - 1)
+            if stratified:
+                # the sizes are drawn independently, the estimate is their average
+                estimate, error = mean.mean(axis=1), np.sqrt(variance.sum(axis=1)) / size
+            else:
+                estimate, error = mean, np.sqrt(variance)
+            if target_error is None or drawn >= max_samples or error.max() <= target_error:
+                break
+        standard_error = np.zeros(self.players_amount)
+        payoff[players] = estimate
+        standard_error[players] = error
+        return ShapleyEstimate(payoff, standard_error, drawn)
+
+    def _permutation_added_values(self, players: np.ndarray, samples: int, empty: Value,
+                                  rng: np.random.Generator) -> np.ndarray:
+        # [i, k] is the added value of players[i] in the k-th random ordering
+        local = rng.permuted(np.tile(np.arange(len(players)), (samples, 1)), axis=1)
+        prefixes = np.bitwise_or.accumulate(np.left_shift(1, players[local]), axis=1)
+        instrumentation.count('batched_values', prefixes.size)
+        values = self._sampled_values(prefixes.ravel()).reshape(prefixes.shape)
+        added = np.empty_like(values)
+        np.put_along_axis(added, local, np.diff(values, axis=1, prepend=empty), axis=1)
+        return added.T
+
+    def _stratified_added_values(self, players: np.ndarray, samples: int, empty: Value,
+                                 rng: np.random.Generator) -> np.ndarray:
+        # [i, s, k] is the added value of players[i] to the k-th random subset of s other players
+        size = len(players)
+        bits = np.left_shift(1, players)
+        added = np.empty((size, size, samples))
+        for s in range(size):
+            # the first s of a random ordering of the others are a uniform subset of size s
+            keys = rng.random((size, samples, size))
+            keys[np.arange(size), :, np.arange(size)] = np.inf
+            chosen = np.argsort(keys, axis=2)[:, :, :s]
+            masks = np.bitwise_or.reduce(bits[chosen], axis=2) if s else np.zeros((size, samples), dtype=np.int64)
+            with_player = masks | bits[:, None]
+            instrumentation.count('batched_values', 2 * masks.size)
+            values = self._sampled_values(np.concatenate([masks.ravel(), with_player.ravel()]))
+            added[:, s] = (values[masks.size:] - values[:masks.size]).reshape(size, samples)
+        return added
+
     def shapely_normal(self, coalition: Coalition) -> Payoff:
         return normalize_payoff(self.shapely_values(coalition))
@@ -1,5 +1,8 @@
-from _types import Coalition, Value, Payoff
+from typing import List, Tuple, Dict, Any
+
+from _types import Coalition, Value, Payoff, Player
 from games.coop_game import CoopGame
+from tools import coalition_to_mask
 
 import numpy as np
 
@@ -10,13 +13,24 @@ class GlovesGame(CoopGame):
         CoopGame.__init__(self, players_amount)
         self.left = set(range(left_amount))
         self.right = self.grand_coalition - self.left
+        self.left_mask = coalition_to_mask(self.left)
+        self.right_mask = coalition_to_mask(self.right)
 
     def is_winning(self, coalition: Coalition) -> bool:
         return bool(coalition & self.left) and bool(coalition & self.right)
 
+    def parameters(self) -> Tuple[tuple, Dict[str, Any]]:
+        return (self.players_amount, len(self.left)), {}
+
+    def player_types(self) -> List[List[Player]]:
+        return [sorted(side) for side in (self.left, self.right) if side]
+
     def value(self, coalition: Coalition) -> Value:
         return float(self.is_winning(coalition))
 
+    def values(self, masks: np.ndarray) -> np.ndarray:
+        return ((masks & self.left_mask != 0) & (masks & self.right_mask != 0)).astype(float)
+
     def shapely_values(self, coalition: Coalition) -> Payoff:
         left = self.left & coalition
         right = self.right & coalition
@@ -1,5 +1,10 @@
-from _types import Coalition, Value, Payoff
+from typing import List, Tuple, Dict, Any
+
+from _types import Coalition, Value, Payoff, Player
 from games.coop_game import CoopGame
+from tools import coalition_to_mask
+
+import numpy as np
 
 
 class PipelineGame(CoopGame):
@@ -13,6 +18,13 @@ class PipelineGame(CoopGame):
                 current_index += 1
                 acc += args[current_index]
             self.pipes[current_index].add(i)
+        self.pipe_masks = [coalition_to_mask(pipe) for pipe in self.pipes]
+
+    def parameters(self) -> Tuple[tuple, Dict[str, Any]]:
+        return tuple(len(pipe) for pipe in self.pipes), {}
+
+    def player_types(self) -> List[List[Player]]:
+        return [sorted(pipe) for pipe in self.pipes if pipe]
 
     def value(self, coalition: Coalition) -> Value:
         for i in self.pipes:
@@ -20,7 +32,17 @@ class PipelineGame(CoopGame):
                 return 0
         return 1
 
+    def values(self, masks: np.ndarray) -> np.ndarray:
+        working = np.ones(len(masks), dtype=bool)
+        for pipe_mask in self.pipe_masks:
+            working &= masks & pipe_mask != 0
+        return working.astype(float)
+
+    def shapely_values(self, coalition: Coalition) -> Payoff:
+        return self.type_shapely_values(coalition)
+
 
 if __name__ == '__main__':
     game = PipelineGame(2, 1, 1)
+    print(CoopGame.shapely_values(game, game.grand_coalition))
     print(game.shapely_values(game.grand_coalition))
@@ -0,0 +1,84 @@
+import itertools
+import types
+from typing import List, Optional
+
+import numpy as np
+
+from _types import Coalition
+from games.boss_game import BossGame
+from games.boss_game_with_unemployment import BossGameWithUnemployment
+from games.cookie_game import CookieGame
+from games.coop_game import CoopGame
+from games.gloves_game import GlovesGame
+from games.pipeline_game import PipelineGame
+from games.shoes_game import ShoesGame
+from graphs.leverage_graph import LeverageGraph
+from graphs.quotient_graph import QuotientGraph
+from tools import mask_to_coalition
+
+# games up to this size also have their leverage graphs compared
+LEVERAGE_CHECK_PLAYERS = 6
+
+
+def shapely_error(game: CoopGame, coalitions: Optional[List[Coalition]] = None) -> float:
+    # largest difference between the game's shapely_values and the generic subset sum over the given coalitions,
+    # every coalition of the game by default
+    if coalitions is None:
+        players = sorted(game.grand_coalition)
+        coalitions = [set(c) for size in range(1, len(players) + 1) for c in itertools.combinations(players, size)]
+    error = 0.0
+    for coalition in coalitions:
+        error = max(error, np.abs(game.shapely_values(coalition) - CoopGame.shapely_values(game, coalition)).max())
+    return error
+
+
+def leverage_identical(game: CoopGame, leverage_epsilon=0.01) -> bool:
+    # whether the game's shapely_values and the generic one give the same graph after a leverage pass, bit for bit.
+    # ties in the rounded payoffs decide the leverage, so an error in the last bit can change the result
+    args, kwargs = game.parameters()
+    reference = type(game)(*args, **kwargs)
+    reference.shapely_values = types.MethodType(CoopGame.shapely_values, reference)
+    graphs = [LeverageGraph(g, leverage_epsilon=leverage_epsilon, compact=True).evaluate_leverage()
+              for g in (game, reference)]
+    return np.array_equal(graphs[0].payoffs, graphs[1].payoffs) and np.array_equal(graphs[0].values, graphs[1].values)
+
+
+def quotient_identical(game: CoopGame) -> bool:
+    # whether the quotient graph gives every state the shapely value of its canonical coalition, bit for bit
+    quotient = QuotientGraph(game)
+    for row in range(1, len(quotient.counts)):
+        expected = CoopGame.shapely_values(game, mask_to_coalition(int(quotient.masks[row])))
+        if not np.array_equal(quotient.shapely_values(row), [expected[players[0]] for players in quotient.types]):
+            return False
+    return True
+
+
+def small_games() -> List[CoopGame]:
+    return [GlovesGame(5, 3), GlovesGame(6, 1), ShoesGame(5, 3), ShoesGame(7, 2), PipelineGame(2, 1, 1),
+            PipelineGame(3, 2, 2), BossGame(4), BossGame(6), BossGameWithUnemployment(4),
+            BossGameWithUnemployment(6), CookieGame(5, 3, 7, 1), CookieGame(5, 3, 7, 1, 2),
+            CookieGame(2, 2, 0, 9, 4, 4, 1), CookieGame(1, 3, 2, value_factor=1.5), CookieGame(1.5, 2, 0.25)]
+
+
+def main():
+    failed = 0
+    for game in small_games():
+        error = shapely_error(game)
+        ok = error < 1e-9
+        check = ''
+        if game.players_amount <= LEVERAGE_CHECK_PLAYERS:
+            identical = leverage_identical(game)
+            ok &= identical
+            check = '  leverage identical' if identical else '  leverage differs'
+        if game.player_types() is not None:
+            identical = quotient_identical(game)
+            ok &= identical
+            check += '  quotient identical' if identical else '  quotient differs'
+        failed += not ok
+        print(f'{"ok" if ok else "FAILED"}  {type(game).__name__}({game.players_amount} players)  {error:.2e}{check}')
+    if failed:
+        raise SystemExit(f'{failed} games disagree with CoopGame.shapely_values')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
-from _types import Coalition, Value, Payoff
+from typing import List, Tuple, Dict, Any
+
+from _types import Coalition, Value, Payoff, Player
 from games.coop_game import CoopGame
+from tools import coalition_to_mask, popcounts
+
+import numpy as np
 
 
 class ShoesGame(CoopGame):
@@ -8,11 +13,27 @@ class ShoesGame(CoopGame):
         CoopGame.__init__(self, players_amount)
         self.left = set(range(left_amount))
         self.right = self.grand_coalition - self.left
+        self.left_mask = coalition_to_mask(self.left)
+        self.right_mask = coalition_to_mask(self.right)
+
+    def parameters(self) -> Tuple[tuple, Dict[str, Any]]:
+        return (self.players_amount, len(self.left)), {}
+
+    def player_types(self) -> List[List[Player]]:
+        return [sorted(side) for side in (self.left, self.right) if side]
 
     def value(self, coalition: Coalition) -> Value:
         return min(len(coalition & self.left), len(coalition & self.right))
 
+    def values(self, masks: np.ndarray) -> np.ndarray:
+        return np.minimum(popcounts(masks & self.left_mask), popcounts(masks & self.right_mask)).astype(float)
+
+    def shapely_values(self, coalition: Coalition) -> Payoff:
+        # left and right shoes are the player types, so the subsets are grouped by their amount of each
+        return self.type_shapely_values(coalition)
+
 
 if __name__ == '__main__':
     game = ShoesGame(5, 3)
+    print(CoopGame.shapely_values(game, game.grand_coalition))
     print(game.shapely_values(game.grand_coalition))
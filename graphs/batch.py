@@ -0,0 +1,127 @@
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+
+import instrumentation
+from _types import Coalition, Value
+from games.coop_game import CoopGame
+from graphs.dominance import batch_dominated_rows, members_matrix
+from graphs.game_graph import GameGraph, BaseNode
+from graphs.leverage_graph import LeverageGraph
+from graphs.threats import batch_min_threats
+from tools import coalition_to_mask, submasks
+
+
+class LeverageBatch:
+    """
+    compact leverage graphs of many games with the same players, kept as one (games, states, players) payoff
+    tensor whose states are shared by every game, in increasing coalition bitmask order as in StateIndex.
+    evaluate_leverage, find_stable and strictly_dominant_set run on all the games at once and give the same
+    results as the compact LeverageGraph of every game, built with parent_average when it is given, graphs gives
+    those graphs
+    """
+
+    def __init__(self, games: List[CoopGame], coalition: Optional[Coalition] = None, leverage_epsilon: Value = 0,
+                 arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None, parent_average=False):
+        if len({game.players_amount for game in games}) > 1:
+            raise ValueError('all the games of a batch must have the same amount of players')
+        if coalition is None:
+            coalition = games[0].grand_coalition
+        self.games = games
+        self.coalition = coalition
+        self.leverage_epsilon = leverage_epsilon
+        self.parent_average = parent_average
+        if arrays is None:
+            # the lattice payoffs depend on the game, so every game builds its own compact graph first
+            graphs = [GameGraph(game, coalition, compact=True, parent_average=parent_average) for game in games]
+            index = graphs[0].state_index
+            self.masks, self.members = index.masks, index.members
+            arrays = (np.stack([graph.payoffs[self.masks] for graph in graphs]),
+                      np.stack([graph.values[self.masks] for graph in graphs]))
+        else:
+            self.masks = np.array(sorted(mask for mask in submasks(coalition_to_mask(coalition)) if mask),
+                                  dtype=np.int64)
+            self.members = members_matrix(self.masks, games[0].players_amount)
+        self.payoffs, self.values = arrays
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def with_payoffs(self, payoffs: np.ndarray) -> 'LeverageBatch':
+        return LeverageBatch(self.games, self.coalition, self.leverage_epsilon, (payoffs, self.values),
+                             self.parent_average)
+
+    def _leverage_pass(self, payoffs: np.ndarray, values: np.ndarray) -> np.ndarray:
+        # LeverageGraph._leverage_rows over every state, with the states of all the games computed together
+        out = payoffs.copy()
+        with instrumentation.phase('leverage_pass'):
+            for row in range(len(self.masks)):
+                players = np.flatnonzero(self.members[row])
+                if len(players) == 1:
+                    continue
+                threats = np.nan_to_num(batch_min_threats(self.members, self.masks, values, payoffs, row,
+                                                          self.leverage_epsilon))
+                # leverages[g, p1, p2] is what p1 owes p2, the threat of p2 over p1 less the threat of p1 over p2,
+                # as in LeverageGraph._leverage_vector
+                leverages = np.maximum(threats.transpose(0, 2, 1) - threats, 0)
+                payoff = out[:, row]
+                for player in players:
+                    leverage = leverages[:, player]
+                    max_pay = leverage.max(axis=1)
+                    total = leverage.sum(axis=1)
+                    normal = np.divide(leverage, total[:, None], out=leverage.copy(), where=total[:, None] != 0)
+                    payoff += normal * max_pay[:, None]
+                    payoff[:, player] -= max_pay
+        return out
+
+    def evaluate_leverage(self) -> 'LeverageBatch':
+        return self.with_payoffs(self._leverage_pass(self.payoffs, self.values))
+
+    def find_stable(self, max_iter=10) -> Tuple['LeverageBatch', np.ndarray]:
+        """
+        find_stable of every game, the iterations array holds the pass at which each game became stable or -1.
+        games stop being computed once they are stable
+        """
+        payoffs = self.payoffs.copy()
+        iterations = np.full(len(self), -1)
+        active = np.arange(len(self))
+        rounded = payoffs.round(2)
+        for i in range(max_iter):
+            if len(active) == 0:
+                break
+            new = self._leverage_pass(payoffs[active], self.values[active])
+            new_rounded = new.round(2)
+            stable = ((new_rounded == rounded[active]) | ~self.members).all(axis=(1, 2))
+            payoffs[active] = new
+            rounded[active] = new_rounded
+            iterations[active[stable]] = i
+            active = active[~stable]
+            instrumentation.iteration(iteration=i, active_games=len(active))
+        return self.with_payoffs(payoffs), iterations
+
+    def dominated(self, strict=True) -> np.ndarray:
+        # [g, s] is True if state s of game g is dominated by another state of that game
+        return batch_dominated_rows(self.payoffs, self.masks, strict=strict)
+
+    def graphs(self) -> List[LeverageGraph]:
+        # the compact leverage graph of every game, over the payoffs of the batch
+        size = 1 << self.games[0].players_amount
+        graphs = []
+        for game, payoffs, values in zip(self.games, self.payoffs, self.values):
+            dense_payoffs, dense_values = np.zeros((size, game.players_amount)), np.zeros(size)
+            dense_payoffs[self.masks], dense_values[self.masks] = payoffs, values
+            graphs.append(LeverageGraph(game, self.coalition, arrays=(dense_payoffs, dense_values),
+                                        leverage_epsilon=self.leverage_epsilon, parent_average=self.parent_average))
+        return graphs
+
+    def strictly_dominant_set(self) -> List[Set[BaseNode]]:
+        return self._dominant_sets(True)
+
+    def loosely_dominant_set(self) -> List[Set[BaseNode]]:
+        return self._dominant_sets(False)
+
+    def _dominant_sets(self, strict: bool) -> List[Set[BaseNode]]:
+        with instrumentation.phase('dominance'):
+            dominated = self.dominated(strict)
+        return [{graph.node(mask) for mask, is_dominated in zip(self.masks.tolist(), row) if not is_dominated}
+                for graph, row in zip(self.graphs(), dominated)]
@@ -0,0 +1,115 @@
+from typing import Optional
+
+import numpy as np
+
+import instrumentation
+
+# upper bound on the amount of payoff comparisons held in memory at once
+BLOCK_ELEMENTS = 1 << 22
+
+
+def members_matrix(masks: np.ndarray, players_amount: int) -> np.ndarray:
+    return (masks[:, None] >> np.arange(players_amount, dtype=masks.dtype)) & 1 == 1
+
+
+def _dominates_block(round_payoffs: np.ndarray, members: np.ndarray, masks: np.ndarray,
+                     dominators: np.ndarray, dominated: np.ndarray, strict: bool) -> np.ndarray:
+    # [i, j] is True if row dominators[i] dominates row dominated[j],
+    # only the players of the dominating coalition are compared, as in GameNode.strictly_dominates
+    instrumentation.count('dominance_comparisons', len(dominators) * len(dominated))
+    result = _compare(round_payoffs[dominators][:, None, :], round_payoffs[dominated][None, :, :],
+                      ~members[dominators][:, None, :], strict)
+    return result & (masks[dominators][:, None] & masks[dominated][None, :] != 0)
+
+
+def _compare(high: np.ndarray, low: np.ndarray, outside: np.ndarray, strict: bool) -> np.ndarray:
+    # high dominates low over the players not outside the dominating coalition, compared along the last axis
+    if strict:
+        return ((high > low) | outside).all(axis=-1)
+    return ((high >= low) | outside).all(axis=-1) & ((high > low) & ~outside).any(axis=-1)
+
+
+def dominated_rows(payoffs: np.ndarray, masks: np.ndarray, strict: bool = True, skyline: bool = False,
+                   block_size: Optional[int] = None) -> np.ndarray:
+    """
+    boolean vector of the rows dominated by another row whose coalition overlaps theirs.
+    the rows are compared in blocks so memory stays bounded. with skyline the dominating rows are
+    scanned in order of decreasing total payoff and rows already known to be dominated are dropped
+    from the following blocks (sort-filter skyline), the result is the same.
+    """
+    rows, players_amount = payoffs.shape
+    round_payoffs = payoffs.round(2)
+    members = members_matrix(masks, players_amount)
+    if block_size is None:
+        block_size = max(1, BLOCK_ELEMENTS // max(1, rows * players_amount))
+    dominated = np.zeros(rows, dtype=bool)
+    if not skyline:
+        everyone = np.arange(rows)
+        for start in range(0, rows, block_size):
+            block = everyone[start:start + block_size]
+            dominated[block] = _dominates_block(round_payoffs, members, masks, everyone, block, strict).any(axis=0)
+        return dominated
+    order = np.argsort(-(round_payoffs * members).sum(axis=1), kind='stable')
+    for start in range(0, rows, block_size):
+        dominators = order[start:start + block_size]
+        alive = np.flatnonzero(~dominated)
+        step = max(1, BLOCK_ELEMENTS // max(1, len(dominators) * players_amount))
+        for inner in range(0, len(alive), step):
+            block = alive[inner:inner + step]
+            dominated[block] |= _dominates_block(round_payoffs, members, masks, dominators, block, strict).any(axis=0)
+    return dominated
+
+
+class DominanceIndex:
+    """
+    the rounded payoffs of the states of a graph, answering which states dominate given payoffs and which states
+    given payoffs dominate, for many queries at once. unlike dominated_rows the coalitions need not overlap,
+    as in BaseNode.strictly_dominates and BaseNode.loosely_dominates
+    """
+    def __init__(self, payoffs: np.ndarray, masks: np.ndarray):
+        self.round_payoffs = payoffs.round(2)
+        self.masks = masks
+        self.members = members_matrix(masks, payoffs.shape[1])
+
+    def _queries(self, payoffs: np.ndarray):
+        # the rounded query payoffs and the amount of queries compared per block
+        queries = np.asarray(payoffs, dtype=float).reshape(-1, self.round_payoffs.shape[1]).round(2)
+        step = max(1, BLOCK_ELEMENTS // max(1, self.round_payoffs.size))
+        return queries, step
+
+    def dominating(self, payoffs: np.ndarray, strict: bool = True) -> np.ndarray:
+        # [q, i] is True if state i dominates payoffs[q]
+        queries, step = self._queries(payoffs)
+        instrumentation.count('dominance_comparisons', len(queries) * len(self.masks))
+        result = np.empty((len(queries), len(self.masks)), dtype=bool)
+        for start in range(0, len(queries), step):
+            result[start:start + step] = _compare(self.round_payoffs[None], queries[start:start + step, None],
+                                                  ~self.members[None], strict)
+        return result
+
+    def dominated(self, payoffs: np.ndarray, masks: np.ndarray, strict: bool = True) -> np.ndarray:
+        # [q, i] is True if payoffs[q], held by the coalition masks[q], dominates state i
+        queries, step = self._queries(payoffs)
+        instrumentation.count('dominance_comparisons', len(queries) * len(self.masks))
+        outside = ~members_matrix(np.asarray(masks, dtype=np.int64).reshape(-1), queries.shape[1])
+        result = np.empty((len(queries), len(self.masks)), dtype=bool)
+        for start in range(0, len(queries), step):
+            result[start:start + step] = _compare(queries[start:start + step, None], self.round_payoffs[None],
+                                                  outside[start:start + step, None], strict)
+        return result
+
+
+def batch_dominated_rows(payoffs: np.ndarray, masks: np.ndarray, strict: bool = True) -> np.ndarray:
+    # dominated_rows of every game of a (games, states, players) payoff tensor whose games share the same states
+    games, rows, players_amount = payoffs.shape
+    round_payoffs = payoffs.round(2)
+    outside = ~members_matrix(masks, players_amount)[:, None, :]
+    overlaps = masks[:, None] & masks[None, :] != 0
+    dominated = np.zeros((games, rows), dtype=bool)
+    step = max(1, BLOCK_ELEMENTS // max(1, rows * rows * players_amount))
+    for start in range(0, games, step):
+        block = round_payoffs[start:start + step]
+        instrumentation.count('dominance_comparisons', len(block) * rows * rows)
+        result = _compare(block[:, :, None, :], block[:, None, :, :], outside, strict) & overlaps
+        dominated[start:start + step] = result.any(axis=1)
+    return dominated
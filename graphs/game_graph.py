@@ -1,24 +1,22 @@
 import itertools
-from typing import Optional, Set, Dict
+from collections import OrderedDict
+from typing import Optional, Set, Dict, List, Tuple
 
-from _types import Coalition, Player, Value, Payoff
-from games.coop_game import CoopGame
-from tools import normalize_payoff
+import numpy as np
 
+import instrumentation
+from _types import Coalition, Player, Value, Payoff, Mask
+from games.coop_game import CoopGame, Seed
+from graphs.dominance import dominated_rows
+from graphs.state_index import StateIndex
+from tools import normalize_payoff, coalition_to_mask, mask_to_coalition, popcount, submasks
+
+# coalitions up to this size always get their exact shapely value
+EXACT_SHAPLEY_PLAYERS = 12
 
-class GameNode:
-    def __init__(self, game: CoopGame, coalition: Coalition, parent: 'GameNode' = None, payoff: Payoff = None):
-        self.coalition = coalition
-        if payoff is None:
-            self.payoff = game.shapely_values(coalition)
-        else:
-            self.payoff = payoff
-        self.value = self.payoff.sum()
-        self.children = set()
-        self.parents = set()
-        if parent is not None:
-            self.parents.add(parent)
-            parent.children.add(self)
+
+class BaseNode:
+    __slots__ = ()
 
     @property
     def round_payoff(self) -> Payoff:
@@ -29,7 +27,8 @@ class GameNode:
         round_payoff = self.round_payoff
         return {i: round_payoff[i] for i in self.coalition}
 
-    def loosely_dominates(self, other: 'GameNode') -> bool:
+    def loosely_dominates(self, other: 'BaseNode') -> bool:
+        instrumentation.count('dominance_comparisons')
         found_pref = False
         for i in self.coalition:
             if self.round_payoff[i] < other.round_payoff[i]:
@@ -38,13 +37,14 @@ class GameNode:
                 found_pref = True  # at least one person prefers it
         return found_pref
 
-    def strictly_dominates(self, other: 'GameNode') -> bool:
+    def strictly_dominates(self, other: 'BaseNode') -> bool:
+        instrumentation.count('dominance_comparisons')
         for i in self.coalition:
             if self.round_payoff[i] <= other.round_payoff[i]:
                 return False  # if someone doesn't prefer this
         return True
 
-    def better_or_equal(self, other: 'GameNode'):
+    def better_or_equal(self, other: 'BaseNode'):
         for i in self.coalition:
             if self.round_payoff[i] < other.round_payoff[i]:
                 return False  # no one dislikes the situation
@@ -56,32 +56,277 @@ class GameNode:
     __repr__ = __str__
 
 
+class GameNode(BaseNode):
+    def __init__(self, game: CoopGame, coalition: Coalition, parent: 'GameNode' = None, payoff: Payoff = None):
+        instrumentation.count('nodes_created')
+        self.coalition = coalition
+        self.mask = coalition_to_mask(coalition)
+        if payoff is None:
+            self.payoff = game.shapely_values(coalition)
+        else:
+            self.payoff = payoff
+        self.value = self.payoff.sum()
+        self.children = set()
+        self.parents = set()
+        if parent is not None:
+            self.parents.add(parent)
+            parent.children.add(self)
+
+
+class ArrayNode(BaseNode):
+    # a view onto one row of a compact graph, links are derived from the coalition bitmask
+    __slots__ = ('graph', 'mask')
+
+    def __init__(self, graph: 'GameGraph', mask: Mask):
+        self.graph = graph
+        self.mask = mask
+
+    @property
+    def coalition(self) -> Coalition:
+        return mask_to_coalition(self.mask)
+
+    @property
+    def payoff(self) -> Payoff:
+        return self.graph.payoffs[self.mask]
+
+    @payoff.setter
+    def payoff(self, payoff: Payoff):
+        self.graph.payoffs[self.mask] = payoff
+
+    @property
+    def value(self) -> Value:
+        return self.graph.values[self.mask]
+
+    @property
+    def children(self) -> Set['ArrayNode']:
+        if popcount(self.mask) == 1:
+            return set()
+        return {ArrayNode(self.graph, self.mask & ~(1 << p)) for p in self.coalition}
+
+    @property
+    def parents(self) -> Set['ArrayNode']:
+        return {ArrayNode(self.graph, self.mask | (1 << p)) for p in self.graph.coalition if not self.mask & (1 << p)}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ArrayNode) and other.graph is self.graph and other.mask == self.mask
+
+    def __hash__(self) -> int:
+        return hash(self.mask)
+
+
+class LazyNode(ArrayNode):
+    # a view onto one coalition of a lazy graph, its payoff is computed on first access
+    __slots__ = ()
+
+    @property
+    def payoff(self) -> Payoff:
+        payoff = self.graph._overrides.get(self.mask)
+        if payoff is None:
+            # the cached entry is read only, payoffs are changed by setting them and then kept as overrides
+            return self.graph._lazy_entry(self.mask)[0]
+        return payoff
+
+    @payoff.setter
+    def payoff(self, payoff: Payoff):
+        self.graph._overrides[self.mask] = payoff
+
+    @property
+    def value(self) -> Value:
+        return self.graph._lazy_entry(self.mask)[1]
+
+
+class _BuiltNode(BaseNode):
+    # the payoff the parent_average build gives a coalition of a lazy graph, whatever was set since
+    __slots__ = ('coalition', 'mask', 'payoff', 'value')
+
+    def __init__(self, coalition: Coalition, mask: Mask, payoff: Payoff):
+        self.coalition = coalition
+        self.mask = mask
+        self.payoff = payoff
+        self.value = payoff.sum()
+
+
 class GameGraph:
-    def __init__(self, game: CoopGame, coalition: Optional[Coalition] = None, merge_same_coalition=True):
+    def __init__(self, game: CoopGame, coalition: Optional[Coalition] = None, merge_same_coalition=True,
+                 parent_average=False, compact=False, shapley_samples: Optional[int] = None,
+                 exact_shapley_players=EXACT_SHAPLEY_PLAYERS, seed: Seed = None,
+                 arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None, lazy=False,
+                 cache_size: Optional[int] = None):
         if coalition is None:
             coalition = game.grand_coalition
         self.game = game
         self.coalition = coalition
-        self.root = GameNode(game, coalition)
-        self._recursive_make_nodes(self.root)
-        if merge_same_coalition:
-            for i in range(1, len(coalition)):
-                for j in itertools.combinations(coalition, i):
-                    all_nodes = self._find_all_nodes(set(j))
-                    iter_nodes = iter(all_nodes)
-                    first = next(iter_nodes)
-                    for k in iter_nodes:
-                        first.payoff += k.payoff
-                        first.parents |= k.parents
-                        for parent in k.parents:
-                            parent.children.remove(k)
-                            parent.children.add(first)
-                    first.payoff /= len(all_nodes)
+        self.parent_average = parent_average
+        # with shapley_samples, coalitions of more than exact_shapley_players players get a sampled shapely value
+        self.shapley_samples = shapley_samples
+        self.exact_shapley_players = exact_shapley_players
+        self._rng = np.random.default_rng(seed)
+        self.nodes: Optional[Dict[Mask, GameNode]] = None
+        # compact graphs keep a single payoff matrix indexed by coalition bitmask instead of node objects.
+        # parent_average graphs are built with one node per coalition, averaging what the best states of its parents
+        # give it (_make_lattice), instead of averaging every removal path of the recursive build. the two only
+        # agree when the paths to a coalition do not disagree, so parent_average is a different model, not a faster
+        # build of the same graph. it is what makes graphs of many players feasible, and lazy graphs need it
+        self.payoffs: Optional[np.ndarray] = None
+        self.values: Optional[np.ndarray] = None
+        # lazy graphs compute the parent_average payoff of a coalition when it is first read and keep up to
+        # cache_size of them, payoffs set afterwards are kept apart and never evicted
+        self._lazy: Optional[OrderedDict] = OrderedDict() if lazy else None
+        self.cache_size = cache_size
+        self._overrides: Dict[Mask, Payoff] = {}
+        with instrumentation.phase('build'):
+            self._build(coalition, merge_same_coalition, parent_average, compact, arrays)
         self.game_set = None
+        self._state_index: Optional[StateIndex] = None
+
+    def _build(self, coalition: Coalition, merge_same_coalition: bool, parent_average: bool, compact: bool,
+               arrays: Optional[Tuple[np.ndarray, np.ndarray]]):
+        game = self.game
+        if self._lazy is not None and not parent_average:
+            raise ValueError('lazy graphs are built with parent_average')
+        if compact and not (merge_same_coalition or parent_average):
+            raise ValueError('compact graphs hold one state per coalition')
+        if arrays is not None:
+            # the payoffs and values of an existing compact graph, nothing is built
+            self.payoffs, self.values = arrays
+            self.root = ArrayNode(self, coalition_to_mask(coalition))
+            return
+        if self._lazy is not None:
+            self.root = LazyNode(self, coalition_to_mask(coalition))
+            return
+        if compact and parent_average:
+            size = 1 << game.players_amount
+            self.payoffs = np.zeros((size, game.players_amount))
+            self.values = np.zeros(size)
+            self.root = self._add_node(coalition_to_mask(coalition), coalition, self.shapely_values(coalition), [])
+        else:
+            self.root = GameNode(game, coalition, payoff=self.shapely_values(coalition))
+        if parent_average:
+            self._make_lattice()
+        else:
+            copies = {self.root.mask: [self.root]}
+            self._recursive_make_nodes(self.root, None, copies)
+        if merge_same_coalition and not parent_average:
+            # the copies of every coalition, in the order they were built, are merged into the first
+            for mask, all_nodes in copies.items():
+                first = all_nodes[0]
+                for k in all_nodes[1:]:
+                    first.payoff += k.payoff
+                    first.parents |= k.parents
+                    for parent in k.parents:
+                        parent.children.remove(k)
+                        parent.children.add(first)
+                first.payoff /= len(all_nodes)
+            # one node per coalition is left, so searches are lookups by mask
+            self.nodes = {mask: all_nodes[0] for mask, all_nodes in copies.items()}
+        if compact and not parent_average:
+            # the merged tree moved into arrays. a node keeps the value of its first copy, as the tree does
+            size = 1 << game.players_amount
+            self.payoffs = np.zeros((size, game.players_amount))
+            self.values = np.zeros(size)
+            for mask, node in self.nodes.items():
+                self.payoffs[mask] = node.payoff
+                self.values[mask] = node.value
+            self.nodes = None
+            self.root = ArrayNode(self, self.root.mask)
+
+    def shapely_values(self, coalition: Coalition) -> Payoff:
+        with instrumentation.phase('shapely_values'):
+            return self._shapely_values(coalition)
+
+    def _shapely_values(self, coalition: Coalition) -> Payoff:
+        if self.shapley_samples is None or len(coalition) <= self.exact_shapley_players:
+            return self.game.shapely_values(coalition)
+        return self.game.sampled_shapely_values(coalition, self.shapley_samples, seed=self._rng).payoff
+
+    @property
+    def state_index(self) -> StateIndex:
+        if self._state_index is None:
+            self._state_index = StateIndex(self)
+        return self._state_index
+
+    def invalidate(self):
+        # must be called after payoffs are changed through the nodes
+        self._state_index = None
+
+    @property
+    def is_lattice(self) -> bool:
+        return self.nodes is not None or self.payoffs is not None or self._lazy is not None
+
+    def node(self, mask: Mask) -> BaseNode:
+        if self.payoffs is not None:
+            return ArrayNode(self, mask)
+        if self._lazy is not None:
+            return LazyNode(self, mask)
+        return self.nodes[mask]
+
+    def _lazy_entry(self, mask: Mask) -> Tuple[Payoff, Value, Mask]:
+        """
+        the payoff, value and best dominating ancestor _make_lattice gives a coalition. the entries it needs that
+        are not cached, its missing ancestors, are computed top down in one pass from the cached ones, which are
+        held until the pass is done, so a read computes every entry at most once whatever the cache size
+        """
+        entry = self._lazy.get(mask)
+        if entry is not None:
+            self._lazy.move_to_end(mask)
+            return entry
+        # the entries the pass reads: the missing ancestors, their parents and the best states of those parents
+        known: Dict[Mask, Optional[Tuple[Payoff, Value, Mask]]] = {}
+        missing = []
+        stack = [mask]
+        while stack:
+            current = stack.pop()
+            if current in known:
+                continue
+            entry = known[current] = self._lazy.get(current)
+            if entry is None:
+                missing.append(current)
+                stack += [current | (1 << p) for p in self.coalition if not current & (1 << p)]
+            else:
+                stack.append(entry[2])
+        for current in sorted(missing, key=popcount, reverse=True):
+            known[current] = self._make_lazy_entry(current, known)
+        for current, entry in known.items():
+            if current in self._lazy:
+                self._lazy.move_to_end(current)
+            else:
+                self._lazy[current] = entry
+        self._lazy.move_to_end(mask)
+        while self.cache_size is not None and len(self._lazy) > self.cache_size:
+            self._lazy.popitem(last=False)
+        return known[mask]
+
+    def _make_lazy_entry(self, mask: Mask, known: Dict[Mask, Tuple[Payoff, Value, Mask]]) -> Tuple[Payoff, Value, Mask]:
+        # the entry of a coalition from the entries of its parents and of their best states
+        instrumentation.count('nodes_created')
+        coalition = mask_to_coalition(mask)
+        shapely = self.shapely_values(coalition)
+        parents = [mask | (1 << p) for p in sorted(self.coalition) if not mask & (1 << p)]
+        bests = [_BuiltNode(mask_to_coalition(best), best, known[best][0])
+                 for best in (known[parent][2] for parent in parents)]
+        if not parents:
+            payoff = shapely
+        else:
+            payoff = self._sub_payoff(bests[0], coalition, shapely)
+            for parent_best in bests[1:]:
+                payoff = payoff + self._sub_payoff(parent_best, coalition, shapely)
+            payoff /= len(parents)
+        payoff.flags.writeable = False
+        current = _BuiltNode(coalition, mask, payoff)
+        for parent_best in bests:
+            if parent_best.loosely_dominates(current):
+                current = parent_best
+        return payoff, payoff.sum(), current.mask
 
-    def search_down(self, coalition: Coalition, start_node: Optional[GameNode] = None) -> Optional[GameNode]:
+    def search_down(self, coalition: Coalition, start_node: Optional[BaseNode] = None) -> Optional[BaseNode]:
         if start_node is None:
+            instrumentation.count('search_down')
             start_node = self.root
+        if self.is_lattice:
+            mask = coalition_to_mask(coalition)
+            if not mask or mask & ~start_node.mask:
+                return None
+            return self.node(mask)
         if start_node.coalition == coalition:
             return start_node
         for i in start_node.children:
@@ -92,7 +337,12 @@ class GameGraph:
                     return val
         return None
 
-    def search_up(self, coalition: Coalition, start_node: GameNode) -> Optional[GameNode]:
+    def search_up(self, coalition: Coalition, start_node: BaseNode) -> Optional[BaseNode]:
+        if self.is_lattice:
+            mask = coalition_to_mask(coalition)
+            if start_node.mask & ~mask or mask & ~self.root.mask:
+                return None
+            return self.node(mask)
         if start_node.coalition == coalition:
             return start_node
         for i in start_node.parents:
@@ -103,50 +353,94 @@ class GameGraph:
                     return val
         return None
 
-    def _find_all_nodes(self, coalition: Coalition, start_node: GameNode = None, found_set=None) -> Set[GameNode]:
-        if found_set is None:
-            found_set = set()
-        if start_node is None:
-            start_node = self.root
-        if start_node.coalition == coalition:
-            found_set.add(start_node)
-        for i in start_node.children:
-            if len(coalition - i.coalition) == 0:
-                # if some element belongs to the coalition but not to i no child of i can represent the coalition
-                self._find_all_nodes(coalition, i, found_set=found_set)
-        return found_set
+    @staticmethod
+    def _sub_payoff(current: BaseNode, sub_coalition: Coalition, payoff: Payoff) -> Payoff:
+        # current is the best upper state the players of sub_coalition can fall back on,
+        # payoff is the shapely value of sub_coalition
+        value = payoff.sum()
+        non_existing = current.coalition - sub_coalition
+        diff = value - current.value + sum(current.payoff[x] for x in non_existing)
+        if diff >= 0:
+            normal = normalize_payoff(payoff)
+            payoff = current.payoff.copy()
+            payoff += normal * diff
+            for i in non_existing:
+                payoff[i] = 0
+        else:
+            pass
+            # not everyone have incentive to remove player
+            # payoff = np.zeros(self.game.players_amount)
+        return payoff
 
-    def _recursive_make_nodes(self, node: GameNode):
+    def _recursive_make_nodes(self, node: GameNode, best: Optional[GameNode], copies: Dict[Mask, List[GameNode]]):
+        # best is the best dominating state carried down the path node was built from, none at the root. node takes
+        # its place when best does not dominate it, so a node is compared once instead of against the whole path,
+        # and its best state is the same for every player it loses
         if len(node.coalition) == 1:
             return
+        instrumentation.count('ancestor_walks')
+        current = best if best is not None and best.loosely_dominates(node) else node
         for player in node.coalition:
             sub_coalition = node.coalition - {player}
-            parents_set = self._to_set_up(node)
-            payoff = self.game.shapely_values(sub_coalition)
-            value = payoff.sum()
-            current = node
-            for i in parents_set:
-                if i.loosely_dominates(current):
-                    current = i
-            non_existing = current.coalition - sub_coalition
-            diff = value - current.value + sum(current.payoff[x] for x in non_existing)
-            # current is now the best upper state
-            if diff >= 0:
-                normal = normalize_payoff(payoff)
-                payoff = current.payoff.copy()
-                payoff += normal * diff
-                for i in non_existing:
-                    payoff[i] = 0
-            else:
-                pass
-                # not everyone have incentive to remove player
-                # payoff = np.zeros(self.game.players_amount)
+            payoff = self._sub_payoff(current, sub_coalition, self.shapely_values(sub_coalition))
             new_node = GameNode(self.game, sub_coalition, node, payoff=payoff)
-            self._recursive_make_nodes(new_node)
+            copies.setdefault(new_node.mask, []).append(new_node)
+            self._recursive_make_nodes(new_node, current, copies)
+
+    def _make_lattice(self):
+        # one node per coalition, built level by level from the root down.
+        # every parent S + p of a coalition S contributes the payoff the removal of p would create,
+        # and S gets their average. the recursive build averages whole removal paths instead, whose payoffs depend
+        # on every state above them, so the two differ once paths to the same parent disagree.
+        # best[mask] is the best loosely dominating state reachable upwards from mask, found greedily
+        # through the best states of the parents, so the ancestors are never rescanned
+        coalition_mask = self.root.mask
+        players = sorted(self.coalition)
+        if self.nodes is None and self.payoffs is None:
+            self.nodes = {coalition_mask: self.root}
+        best = {coalition_mask: coalition_mask}
+        level = [coalition_mask]
+        for _ in range(len(players) - 1):
+            next_level = set()
+            for mask in level:
+                for p in players:
+                    if mask & (1 << p):
+                        next_level.add(mask & ~(1 << p))
+            level = sorted(next_level)
+            for mask in level:
+                sub_coalition = mask_to_coalition(mask)
+                parents = [mask | (1 << p) for p in players if not mask & (1 << p)]
+                shapely = self.shapely_values(sub_coalition)
+                payoff = self._sub_payoff(self.node(best[parents[0]]), sub_coalition, shapely)
+                for parent in parents[1:]:
+                    payoff = payoff + self._sub_payoff(self.node(best[parent]), sub_coalition, shapely)
+                payoff /= len(parents)
+                current = self._add_node(mask, sub_coalition, payoff, parents)
+                for parent in parents:
+                    parent_best = self.node(best[parent])
+                    if parent_best.loosely_dominates(current):
+                        current = parent_best
+                best[mask] = current.mask
 
-    def to_set(self) -> Set[GameNode]:
+    def _add_node(self, mask: Mask, coalition: Coalition, payoff: Payoff, parents: List[Mask]) -> BaseNode:
+        if self.payoffs is not None:
+            instrumentation.count('nodes_created')
+            self.payoffs[mask] = payoff
+            self.values[mask] = payoff.sum()
+            return ArrayNode(self, mask)
+        node = GameNode(self.game, coalition, payoff=payoff)
+        for parent in parents:
+            node.parents.add(self.nodes[parent])
+            self.nodes[parent].children.add(node)
+        self.nodes[mask] = node
+        return node
+
+    def to_set(self) -> Set[BaseNode]:
         if self.game_set is None:
-            self.game_set = self._to_set_down()
+            if self.payoffs is not None or self._lazy is not None:
+                self.game_set = {self.node(mask) for mask in submasks(self.root.mask) if mask}
+            else:
+                self.game_set = self._to_set_down()
         return self.game_set
 
     def _to_set_down(self, node: Optional[GameNode] = None, existing: Optional[Set[GameNode]] = None) -> Set[GameNode]:
@@ -160,43 +454,92 @@ class GameGraph:
                 self._to_set_down(i, existing)
         return existing
 
-    def _to_set_up(self, node: GameNode, existing: Optional[Set[GameNode]] = None) -> Set[GameNode]:
-        if existing is None:
-            existing = set()
-        for i in node.parents:
-            if i not in existing:
-                existing.add(i)
-                self._to_set_up(i, existing)
-        return existing
+    def payoff_matrix(self, states: List[BaseNode]) -> np.ndarray:
+        if self.payoffs is not None:
+            return self.payoffs[[state.mask for state in states]]
+        return np.array([state.payoff for state in states]).reshape(len(states), self.game.players_amount)
+
+    def set_payoff_matrix(self, payoffs: np.ndarray):
+        # payoffs has one row per state of state_index
+        index = self.state_index
+        if self.payoffs is not None:
+            self.payoffs[index.masks] = payoffs
+        else:
+            for state, payoff in zip(index.states, payoffs):
+                state.payoff = payoff.copy()
+        self.invalidate()
+
+    def _dominant_set(self, strict: bool, skyline: bool) -> Set[BaseNode]:
+        index = self.state_index
+        with instrumentation.phase('dominance'):
+            dominated = dominated_rows(index.payoffs, index.masks, strict=strict, skyline=skyline)
+        return {state for state, is_dominated in zip(index.states, dominated) if not is_dominated}
 
-    def strictly_dominant_set(self) -> Set[GameNode]:
+    def strictly_dominant_set(self, vectorized=True, skyline=False) -> Set[BaseNode]:
+        if vectorized:
+            return self._dominant_set(True, skyline)
         states = self.to_set().copy()
-        for i, j in itertools.combinations(self.to_set(), 2):
-            if not (i.coalition & j.coalition):
-                continue
-            if i.strictly_dominates(j) and j in states:
-                states.remove(j)
-            if j.strictly_dominates(i) and i in states:
-                states.remove(i)
+        with instrumentation.phase('dominance'):
+            for i, j in itertools.combinations(self.to_set(), 2):
+                if not (i.coalition & j.coalition):
+                    continue
+                if i.strictly_dominates(j) and j in states:
+                    states.remove(j)
+                if j.strictly_dominates(i) and i in states:
+                    states.remove(i)
         return states
 
-    def loosely_dominant_set(self) -> Set[GameNode]:
+    def loosely_dominant_set(self, vectorized=True, skyline=False) -> Set[BaseNode]:
+        if vectorized:
+            return self._dominant_set(False, skyline)
         states = self.to_set().copy()
-        for i, j in itertools.combinations(self.to_set(), 2):
-            if not (i.coalition & j.coalition):
-                continue
-            if i.loosely_dominates(j) and j in states:
-                states.remove(j)
-            if j.loosely_dominates(i) and i in states:
-                states.remove(i)
+        with instrumentation.phase('dominance'):
+            for i, j in itertools.combinations(self.to_set(), 2):
+                if not (i.coalition & j.coalition):
+                    continue
+                if i.loosely_dominates(j) and j in states:
+                    states.remove(j)
+                if j.loosely_dominates(i) and i in states:
+                    states.remove(i)
         return states
 
+    def dense_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        # the payoffs and values indexed by coalition bitmask, the arrays of a compact graph
+        if self.payoffs is not None:
+            return self.payoffs, self.values
+        index = self.state_index
+        if not index.unique:
+            raise ValueError('graphs holding several states per coalition have no dense form')
+        size = 1 << self.game.players_amount
+        payoffs, values = np.zeros((size, self.game.players_amount)), np.zeros(size)
+        payoffs[index.masks], values[index.masks] = index.payoffs, index.values
+        return payoffs, values
+
+    def save(self, path: str):
+        from graphs.storage import save_graph
+        save_graph(self, path)
+
     def deepcopy(self) -> 'GameGraph':
         from copy import deepcopy
-        return deepcopy(self)
+        # the game is immutable, sharing it keeps its characteristic function cache shared as well.
+        # the state index is dropped since the copy is usually about to be modified
+        return deepcopy(self, {id(self.game): self.game, id(self._state_index): None})
+
+    def all_strictly_dominant(self, node: BaseNode) -> Set[BaseNode]:
+        return self.dominating_states([node])[0]
+
+    def dominating_states(self, nodes: List[BaseNode], strict=True) -> List[Set[BaseNode]]:
+        # for every node the states of the graph that dominate it, all nodes are compared at once
+        index = self.state_index
+        dominating = index.dominance.dominating([node.payoff for node in nodes], strict=strict)
+        return [{index.states[row] for row in np.flatnonzero(found)} for found in dominating]
 
-    def all_strictly_dominant(self, node: GameNode):
-        return {i for i in self.to_set() if i.strictly_dominates(node)}
+    def dominated_states(self, nodes: List[BaseNode], strict=True) -> List[Set[BaseNode]]:
+        # for every node the states of the graph it dominates
+        index = self.state_index
+        dominated = index.dominance.dominated([node.payoff for node in nodes], [node.mask for node in nodes],
+                                              strict=strict)
+        return [{index.states[row] for row in np.flatnonzero(found)} for found in dominated]
 
     def __eq__(self, other: 'GameGraph') -> bool:
         if len(other.to_set()) != len(self.to_set()):
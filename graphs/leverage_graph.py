@@ -1,26 +1,45 @@
 import itertools
-from typing import Dict, Tuple, Set, List
+from typing import Dict, Tuple, Set, List, Optional, Iterator, Iterable, NamedTuple
 
 from _types import Player, Value, Payoff
 from games.coop_game import CoopGame
-from graphs.game_graph import GameGraph, GameNode
+from graphs.game_graph import GameGraph, BaseNode
+from graphs.parallel import LeveragePool
+from graphs.state_index import StateIndex
+from graphs.threats import min_threats
 from tools import normalize_payoff
 
 import numpy as np
 
+import instrumentation
+
+
+class StableSolution(NamedTuple):
+    graph: 'LeverageGraph'
+    iterations: int  # leverage passes run
+    converged: bool
+    residuals: List[float]  # largest payoff change of every pass
+
 
 class LeverageGraph(GameGraph):
     def __init__(self, game: CoopGame, *args, leverage_epsilon: Value = 0, **kwargs):
         GameGraph.__init__(self, game, *args, **kwargs)
         self.leverage_epsilon = leverage_epsilon
 
-    def threat_states(self, state: GameNode, player: Player, opponent: Player) -> Set[Tuple[GameNode, Value]]:
+    @classmethod
+    def from_graph(cls, graph: GameGraph, leverage_epsilon: Value = 0) -> 'LeverageGraph':
+        # a leverage graph over the payoffs of an already built graph, sharing its arrays.
+        # only the threats depend on leverage_epsilon, so one build serves every epsilon
+        return cls(graph.game, graph.coalition, arrays=graph.dense_arrays(), leverage_epsilon=leverage_epsilon,
+                   parent_average=graph.parent_average)
+
+    def threat_states(self, state: BaseNode, player: Player, opponent: Player) -> Set[Tuple[BaseNode, Value]]:
         all_with_player = {x for x in self.to_set() if
                            player in x.coalition and x.payoff[player] >= state.payoff[player]}
-        all_where_credible: Set[GameNode] = set()
+        all_where_credible: Set[BaseNode] = set()
         for i in all_with_player:
             sum_of_losses = sum(
-                max(state.payoff[x] - i.payoff[x], 0) for x in i.coalition & state.coalition - {opponent})
+                max(state.payoff[x] - i.payoff[x], 0) for x in sorted(i.coalition & state.coalition - {opponent}))
             # sum of losses of all players who's agreement is needed in order to switch from state to i
             if sum_of_losses <= i.payoff[player] - state.payoff[player]:
                 # if player can make up the losses of all players
@@ -44,7 +63,7 @@ class LeverageGraph(GameGraph):
                 if i.coalition & j.coalition:
                     # if there is any overlap between the coalitions, it is enough for player to convince the
                     # overlapping players not to switch from i to j
-                    accumulated = sum(i.payoff[x] - j.payoff[x] for x in j.coalition & i.coalition) + \
+                    accumulated = sum(i.payoff[x] - j.payoff[x] for x in sorted(j.coalition & i.coalition)) + \
                                   player_marginal
 
                 else:
@@ -54,6 +73,7 @@ class LeverageGraph(GameGraph):
                     if accumulated < 0:
                         # player cant prevent moving to j
                         accumulated = 0
+                instrumentation.count('threat_state_evaluations')
                 # for every coalition with opponent and without player
                 # subtract how much other players in both coalitions prefer this option (plus how much player can add)
                 # from how much does the opponent gain from j relative to i (spare opponent gains)
@@ -69,18 +89,35 @@ class LeverageGraph(GameGraph):
 
         return filtered_credible
 
-    def leverages(self, state: GameNode, player: Player, opponent: Player, threat_states=None) -> List[Value]:
+    def leverages(self, state: BaseNode, player: Player, opponent: Player, threat_states=None) -> List[Value]:
         if threat_states is None:
             threat_states = self.threat_states(state, player, opponent)
         if len(threat_states) == 0:
             return []  # this is the best state for player, no leverage at all
         return [x[1] for x in sorted(threat_states, key=lambda x: x[1])]
 
-    def get_leverage_vector(self, state: GameNode) -> Dict[Player, Payoff]:
-        leverages = {p: np.zeros(self.game.players_amount) for p in state.coalition}
-        for p1, p2 in itertools.combinations(state.coalition, 2):
-            p1_leverage = self.leverages(state, p1, p2)
-            p2_leverage = self.leverages(state, p2, p1)
+    def min_threat_matrix(self, state: BaseNode) -> np.ndarray:
+        # [player, opponent] is the smallest threat player has over opponent, nan if there is none
+        index = self.state_index
+        return min_threats(index, index.payoffs, index.rows[state], self.leverage_epsilon)
+
+    def get_leverage_vector(self, state: BaseNode, vectorized=True) -> Dict[Player, Payoff]:
+        if vectorized:
+            return self._leverage_vector(self.game.players_amount, state.coalition,
+                                         self._threat_lookup(self.min_threat_matrix(state)))
+        return self._leverage_vector(self.game.players_amount, state.coalition,
+                                     lambda p1, p2: self.leverages(state, p1, p2))
+
+    @staticmethod
+    def _threat_lookup(threats: np.ndarray):
+        return lambda p1, p2: [] if np.isnan(threats[p1, p2]) else [threats[p1, p2]]
+
+    @classmethod
+    def _leverage_vector(cls, players_amount: int, coalition, leverages_of) -> Dict[Player, Payoff]:
+        leverages = {p: np.zeros(players_amount) for p in sorted(coalition)}
+        for p1, p2 in itertools.combinations(coalition, 2):
+            p1_leverage = leverages_of(p1, p2)
+            p2_leverage = leverages_of(p2, p1)
             if len(p1_leverage) == 0 and len(p2_leverage) == 0:
                 leverages[p2][p1] = 0
                 leverages[p1][p2] = 0
@@ -91,7 +128,7 @@ class LeverageGraph(GameGraph):
                 leverages[p2][p1] = p1_leverage[0]
                 leverages[p1][p2] = 0
             else:
-                dlp1, dlp2 = self.handle_double_leverage(p1_leverage, p2_leverage)
+                dlp1, dlp2 = cls.handle_double_leverage(p1_leverage, p2_leverage)
                 leverages[p2][p1] = dlp1
                 leverages[p1][p2] = dlp2
         # if both of them have leverage on the other
@@ -103,60 +140,288 @@ class LeverageGraph(GameGraph):
     def handle_double_leverage(p1_leverage, p2_leverage) -> Tuple[Value, Value]:
         return max(p1_leverage[0] - p2_leverage[0], 0), max(p2_leverage[0] - p1_leverage[0], 0)
 
-    def evaluate_leverage(self) -> 'LeverageGraph':
-        new_tree = self.deepcopy()
-        for state in self.to_set():
-            if len(state.coalition) == 1:
+    @staticmethod
+    def _apply_leverage(payoff: Payoff, leverage_vector: Dict[Player, Payoff]):
+        for player in leverage_vector:
+            max_pay = max(leverage_vector[player])
+            normal = normalize_payoff(leverage_vector[player])
+            payoff += normal * max_pay
+            payoff[player] -= max_pay
+
+    @classmethod
+    def _leverage_rows(cls, index: StateIndex, leverage_epsilon: Value, payoffs: np.ndarray, out: np.ndarray,
+                       rows: Iterable[int]):
+        # the new payoffs of the given rows, everything the computation needs is in the index and the matrix
+        players_amount = payoffs.shape[1]
+        for row in rows:
+            out[row] = payoffs[row]
+            coalition = np.flatnonzero(index.members[row]).tolist()
+            if len(coalition) == 1:
                 continue
-            state_copy = new_tree.search_down(state.coalition)
-            leverage_vector = self.get_leverage_vector(state)
-            for player in leverage_vector:
-                max_pay = max(leverage_vector[player])
-                normal = normalize_payoff(leverage_vector[player])
-                state_copy.payoff += normal * max_pay
-                state_copy.payoff[player] -= max_pay
+            threats = min_threats(index, payoffs, row, leverage_epsilon)
+            cls._apply_leverage(out[row], cls._leverage_vector(players_amount, coalition, cls._threat_lookup(threats)))
+
+    def _leverage_pass(self, payoffs: np.ndarray, out: np.ndarray, pool: Optional[LeveragePool] = None,
+                       rows: Optional[np.ndarray] = None) -> np.ndarray:
+        # one evaluate_leverage pass over a payoff matrix aligned with state_index, written into out.
+        # when rows is given only those states are recomputed and the rest keep their payoffs
+        with instrumentation.phase('leverage_pass'):
+            if pool is not None:
+                return pool.leverage_pass(payoffs, out, rows)
+            if rows is None:
+                rows = range(len(self.state_index))
+            else:
+                out[...] = payoffs
+            self._leverage_rows(self.state_index, self.leverage_epsilon, payoffs, out, rows)
+            return out
+
+    def iterate_payoffs(self, max_iter: Optional[int] = None, workers: Optional[int] = None,
+                        incremental=False) -> Iterator[np.ndarray]:
+        """
+        the payoff matrix (rows aligned with state_index) after each evaluate_leverage pass.
+        the passes write into two preallocated buffers in turn, so a yielded matrix is only valid until the
+        pass after the next one, copy it to keep it.
+        with workers the states of every pass are split over a process pool.
+        the leverage of a state only reads the payoffs of the states that share a player with it, so with
+        incremental a pass only recomputes the states overlapping a state that changed in the previous pass,
+        the others would come out the same. the amount of states a pass recomputed is reported to instrumentation,
+        as the recomputed_states counter and in the entry of every iteration
+        """
+        index = self.state_index
+        players = index.members.sum(axis=1) > 1
+        current = index.payoffs.copy()
+        following = np.empty_like(current)
+        rows = None
+        with LeveragePool.optional(self, workers) as pool:
+            i = 0
+            while max_iter is None or i < max_iter:
+                self._leverage_pass(current, following, pool, rows)
+                recomputed = int(players.sum()) if rows is None else len(rows)
+                instrumentation.count('recomputed_states', recomputed)
+                if incremental:
+                    changed = (following != current).any(axis=1)
+                    touched = np.bitwise_or.reduce(index.masks[changed])
+                    rows = np.flatnonzero((index.masks & touched != 0) & players)
+                current, following = following, current
+                instrumentation.iteration(iteration=i, recomputed_states=recomputed)
+                yield current
+                i += 1
+
+    def with_payoffs(self, payoffs: np.ndarray) -> 'LeverageGraph':
+        # a compact graph over payoffs (rows aligned with state_index) and the values of this graph, as in
+        # from_graph. nothing is deep copied, which the linked nodes of large trees would not survive
+        index = self.state_index
+        dense = np.zeros((1 << self.game.players_amount, self.game.players_amount))
+        dense[index.masks] = payoffs
+        if self.values is not None:
+            values = self.values
+        else:
+            values = np.zeros(len(dense))
+            values[index.masks] = index.values
+        return type(self)(self.game, self.coalition, arrays=(dense, values), leverage_epsilon=self.leverage_epsilon,
+                          parent_average=self.parent_average)
+
+    def _matrix_passes(self, vectorized: bool, workers: Optional[int], incremental=False) -> bool:
+        # whether the passes run over the payoff matrix, workers and incremental are only honoured there
+        if vectorized and self.state_index.unique:
+            return True
+        if workers is not None or incremental:
+            raise ValueError('workers and incremental need vectorized passes over a graph with one state per coalition')
+        return False
+
+    def evaluate_leverage(self, vectorized=True, workers: Optional[int] = None) -> 'LeverageGraph':
+        if self._matrix_passes(vectorized, workers):
+            payoffs = self.state_index.payoffs
+            with LeveragePool.optional(self, workers) as pool:
+                return self.with_payoffs(self._leverage_pass(payoffs, np.empty_like(payoffs), pool))
+        new_tree = self.deepcopy()
+        with instrumentation.phase('leverage_pass'):
+            for state in self.to_set():
+                if len(state.coalition) == 1:
+                    continue
+                state_copy = new_tree.search_down(state.coalition)
+                payoff = state_copy.payoff.copy()
+                self._apply_leverage(payoff, self.get_leverage_vector(state, vectorized=vectorized))
+                state_copy.payoff = payoff
+        new_tree.invalidate()
         return new_tree
 
-    def find_stable(self, max_iter=10) -> Tuple['LeverageGraph', int]:
+    def find_stable(self, max_iter=10, vectorized=True, workers: Optional[int] = None,
+                    incremental=False) -> Tuple['LeverageGraph', int]:
+        if self._matrix_passes(vectorized, workers, incremental):
+            # no graph is copied until the result is known
+            index = self.state_index
+            previous, previous_fingerprint = index.payoffs, index.fingerprint(index.payoffs)
+            for i, payoffs in enumerate(self.iterate_payoffs(max_iter, workers, incremental)):
+                fingerprint = index.fingerprint(payoffs)
+                if fingerprint == previous_fingerprint:
+                    return self.with_payoffs(payoffs), i
+                previous, previous_fingerprint = payoffs, fingerprint
+            return (self if previous is index.payoffs else self.with_payoffs(previous)), -1
         current_tree = self
         for i in range(max_iter):
-            new_tree = current_tree.evaluate_leverage()
+            new_tree = current_tree.evaluate_leverage(vectorized=vectorized)
+            instrumentation.iteration(iteration=i)
             if new_tree == current_tree:
                 return new_tree, i
             current_tree = new_tree
         return current_tree, -1
 
-    def find_stable_circulation(self, max_iter=10) -> Tuple[List['LeverageGraph'], int, int]:
+    def solve_stable(self, max_iter=100, tolerance=1e-6, damping=1.0, anderson=0,
+                     workers: Optional[int] = None) -> StableSolution:
+        """
+        find_stable as a fixed point search over the payoff matrix x, which every pass maps to leverage(x).
+        the residual of a pass is the largest payoff change leverage(x) - x, the search stops once it is within
+        tolerance and returns the graph of the last leverage(x).
+        with damping below 1 only that part of the change is taken, which settles many of the oscillations
+        find_stable gives up on. with anderson above 0 the next matrix is extrapolated from the last anderson + 1
+        passes (anderson acceleration), the history is dropped whenever the residual grows
+        """
+        index = self.state_index
+        if not index.unique:
+            raise ValueError('solve_stable needs a graph with one state per coalition')
+        current = index.payoffs.copy()
+        mapped = np.empty_like(current)
+        points: List[np.ndarray] = []
+        changes: List[np.ndarray] = []
+        residuals = []
+        with LeveragePool.optional(self, workers) as pool:
+            for i in range(max_iter):
+                self._leverage_pass(current, mapped, pool)
+                change = mapped - current
+                residuals.append(float(np.abs(change).max(initial=0)))
+                instrumentation.iteration(iteration=i, residual=residuals[-1])
+                if residuals[-1] <= tolerance:
+                    return StableSolution(self.with_payoffs(mapped), i + 1, True, residuals)
+                if not anderson:
+                    current = current + damping * change
+                    continue
+                if len(residuals) > 1 and residuals[-1] > residuals[-2]:
+                    points, changes = [], []
+                points = (points + [current.ravel()])[-anderson - 1:]
+                changes = (changes + [change.ravel()])[-anderson - 1:]
+                current = self._anderson_step(points, changes, damping).reshape(current.shape)
+        return StableSolution(self.with_payoffs(mapped), max_iter, False, residuals)
+
+    @staticmethod
+    def _anderson_step(points: List[np.ndarray], changes: List[np.ndarray], damping: float) -> np.ndarray:
+        # the damped step from the combination of the last points whose changes cancel out the most
+        point, change = points[-1], changes[-1]
+        if len(points) == 1:
+            return point + damping * change
+        point_steps = np.diff(points, axis=0).T
+        change_steps = np.diff(changes, axis=0).T
+        gamma = np.linalg.lstsq(change_steps, change, rcond=None)[0]
+        return point + damping * change - (point_steps + damping * change_steps) @ gamma
+
+    def find_stable_circulation(self, max_iter=10, vectorized=True, workers: Optional[int] = None,
+                                incremental=False) -> Tuple[List['LeverageGraph'], int, int]:
+        if self._matrix_passes(vectorized, workers, incremental):
+            # trees are matched by the fingerprint of their rounded payoffs instead of against each other
+            index = self.state_index
+            trees = [self.with_payoffs(index.payoffs)]
+            seen = {index.fingerprint(index.payoffs): 0}
+            for i, payoffs in enumerate(self.iterate_payoffs(max_iter, workers, incremental)):
+                fingerprint = index.fingerprint(payoffs)
+                if fingerprint in seen:
+                    return trees, i, seen[fingerprint]
+                seen[fingerprint] = len(trees)
+                trees.append(self.with_payoffs(payoffs))
+            return trees, -1, -1
         current_tree = self.deepcopy()
         trees = [current_tree]
         for i in range(max_iter):
-            current_tree = current_tree.evaluate_leverage()
+            current_tree = current_tree.evaluate_leverage(vectorized=vectorized)
+            instrumentation.iteration(iteration=i)
             for j, t in enumerate(trees):
                 if t == current_tree:
                     return trees, i, j
             trees.append(current_tree)
         return trees, -1, -1
 
-    def average_stable_tree(self, max_iter=10) -> 'LeverageGraph':
-        trees, _, _ = self.find_stable_circulation(max_iter)
+    def find_cycle(self, max_iter=10, workers: Optional[int] = None,
+                   incremental=False) -> Tuple[List[np.ndarray], int, int]:
+        """
+        same detection as find_stable_circulation, but only fingerprints are kept while searching.
+        returns the payoff matrices (aligned with state_index) of the trees j..i that make up the cycle,
+        recomputed once the cycle is known, or an empty list and -1, -1 if there is none within max_iter
+        """
+        index = self.state_index
+        seen = {index.fingerprint(index.payoffs): 0}
+        for i, payoffs in enumerate(self.iterate_payoffs(max_iter, workers, incremental)):
+            fingerprint = index.fingerprint(payoffs)
+            if fingerprint in seen:
+                j = seen[fingerprint]
+                break
+            seen[fingerprint] = i + 1
+        else:
+            return [], -1, -1
+        cycle = [index.payoffs.copy()] if j == 0 else []
+        for k, payoffs in enumerate(self.iterate_payoffs(i, workers, incremental), 1):
+            if k >= j:
+                cycle.append(payoffs.copy())
+        return cycle, i, j
+
+    def average_stable_tree(self, max_iter=10, vectorized=True, workers: Optional[int] = None,
+                            incremental=False) -> 'LeverageGraph':
+        if self._matrix_passes(vectorized, workers, incremental):
+            # the trees are summed as they come, only their fingerprints are kept
+            index = self.state_index
+            total = index.payoffs.copy()
+            count = 1
+            seen = {index.fingerprint(index.payoffs)}
+            for payoffs in self.iterate_payoffs(max_iter, workers, incremental):
+                fingerprint = index.fingerprint(payoffs)
+                if fingerprint in seen:
+                    break
+                seen.add(fingerprint)
+                total += payoffs
+                count += 1
+            return self.with_payoffs(total / count)
+        trees, _, _ = self.find_stable_circulation(max_iter, vectorized=vectorized)
         base_tree = trees.pop()
         for i in trees:
             for j in i.to_set():
-                base_tree.search_down(j.coalition).payoff += j.payoff
+                # set rather than added in place, lazy graphs hand out read only payoffs
+                state = base_tree.search_down(j.coalition)
+                state.payoff = state.payoff + j.payoff
         for i in base_tree.to_set():
-            i.payoff /= len(trees) + 1
+            i.payoff = i.payoff / (len(trees) + 1)
+        base_tree.invalidate()
         return base_tree
 
-    def average_tree(self, iterations=10) -> 'LeverageGraph':
+    def running_averages(self, max_iter: Optional[int] = None, workers: Optional[int] = None,
+                         incremental=False) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        the payoff matrix after each evaluate_leverage pass together with the average of all the matrices so
+        far, this graph's included. only a running sum is kept, so long runs can be monitored and stopped early.
+        the pass matrix is only valid until the pass after the next one, as in iterate_payoffs
+        """
+        total = self.state_index.payoffs.copy()
+        for count, payoffs in enumerate(self.iterate_payoffs(max_iter, workers, incremental), 2):
+            total += payoffs
+            yield payoffs, total / count
+
+    def average_tree(self, iterations=10, vectorized=True, workers: Optional[int] = None,
+                     incremental=False) -> 'LeverageGraph':
+        if self._matrix_passes(vectorized, workers, incremental):
+            average = self.state_index.payoffs
+            for _, average in self.running_averages(iterations, workers, incremental):
+                pass
+            return self.with_payoffs(average)
         trees = []
         current_tree = self
         for i in range(iterations):
-            current_tree = current_tree.evaluate_leverage()
+            current_tree = current_tree.evaluate_leverage(vectorized=vectorized)
+            instrumentation.iteration(iteration=i)
             trees.append(current_tree)
         base_tree = self.deepcopy()
         for i in trees:
             for j in i.to_set():
-                base_tree.search_down(j.coalition).payoff += j.payoff
+                # set rather than added in place, lazy graphs hand out read only payoffs
+                state = base_tree.search_down(j.coalition)
+                state.payoff = state.payoff + j.payoff
         for i in base_tree.to_set():
-            i.payoff /= len(trees) + 1
+            i.payoff = i.payoff / (len(trees) + 1)
+        base_tree.invalidate()
         return base_tree
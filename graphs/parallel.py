@@ -0,0 +1,83 @@
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from graphs.state_index import StateIndex
+
+# set in every worker process by _init_worker
+_worker = None
+
+
+def _init_worker(graph_class, index: StateIndex, leverage_epsilon, names, shape):
+    global _worker
+    memories = [SharedMemory(name) for name in names]
+    source, target = [np.ndarray(shape, dtype=float, buffer=memory.buf) for memory in memories]
+    _worker = (graph_class, index, leverage_epsilon, source, target, memories)
+
+
+def _leverage_rows(rows: np.ndarray):
+    graph_class, index, leverage_epsilon, source, target, _ = _worker
+    graph_class._leverage_rows(index, leverage_epsilon, source, target, rows)
+
+
+class LeveragePool:
+    """
+    a process pool that runs evaluate_leverage passes of one graph. every state only reads the payoffs of the
+    previous pass, so the states are split between the workers, which read the payoff matrix from shared memory
+    and write their rows of the next one into another shared block. each row is computed exactly as in a serial
+    pass, so the result does not depend on the amount of workers
+    """
+
+    def __init__(self, graph, workers: int):
+        index = graph.state_index
+        self.shape = index.payoffs.shape
+        size = max(1, index.payoffs.nbytes)
+        self._memories = [SharedMemory(create=True, size=size) for _ in range(2)]
+        self._source, self._target = [np.ndarray(self.shape, dtype=float, buffer=memory.buf)
+                                      for memory in self._memories]
+        # bigger coalitions cost more, dealing the rows round robin keeps the chunks balanced
+        chunks = min(len(index), workers * 4)
+        self._chunks = [np.arange(start, len(index), chunks) for start in range(chunks)]
+        self._executor = ProcessPoolExecutor(
+            workers, initializer=_init_worker,
+            initargs=(type(graph), index, graph.leverage_epsilon, [memory.name for memory in self._memories],
+                      self.shape))
+
+    def leverage_pass(self, payoffs: np.ndarray, out: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        self._source[...] = payoffs
+        if rows is None:
+            chunks = self._chunks
+        else:
+            chunks = [chunk for chunk in (rows[start::len(self._chunks)] for start in range(len(self._chunks)))
+                      if len(chunk)]
+        for _ in self._executor.map(_leverage_rows, chunks):
+            pass
+        if rows is None:
+            out[...] = self._target
+        else:
+            out[...] = payoffs
+            out[rows] = self._target[rows]
+        return out
+
+    def close(self):
+        self._executor.shutdown()
+        del self._source, self._target
+        for memory in self._memories:
+            memory.close()
+            memory.unlink()
+
+    def __enter__(self) -> 'LeveragePool':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def optional(graph, workers: Optional[int]):
+        # a pool when more than one worker is asked for, None otherwise
+        if workers is None or workers <= 1:
+            return contextlib.nullcontext()
+        return LeveragePool(graph, workers)
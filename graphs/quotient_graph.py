@@ -0,0 +1,326 @@
+import copy
+import math
+from fractions import Fraction
+from typing import List, Set, Tuple, Iterable
+
+import numpy as np
+
+from _types import Coalition, Value, Payoff, Mask
+from games.coop_game import CoopGame
+from graphs.dominance import BLOCK_ELEMENTS
+from graphs.leverage_graph import LeverageGraph
+from tools import coalition_to_mask, counted_orderings
+
+# the amount of players of every type in a coalition
+Counts = Tuple[int, ...]
+
+
+class QuotientGraph:
+    """
+    the parent_average graph of a game whose players come in types of interchangeable players (CoopGame.player_types).
+    all the coalitions holding the same amount of players of every type share their payoffs up to renaming the
+    players, so a state stands for all of them and keeps one payoff per type: prod(k_i + 1) - 1 states of
+    len(types) payoffs instead of 2^n - 1 states of n payoffs.
+    where the parent_average build compares two nodes the quotient compares the canonical coalitions of the two states
+    (the first players of every type), so when several symmetric ancestors tie the dominating one may be picked
+    differently. the shapely values are those of the game bit for bit, the built payoffs are those of a compact
+    LeverageGraph built with parent_average up to float summation order. the leverage passes sum per type in another
+    order and compare payoffs to thresholds and rounded to two decimals, so a difference in the last bit can flip a
+    threat or a dominance: after a few passes the payoffs, the stable states and the iterations find_stable takes
+    may differ from that graph. they are not those of the default recursive build either, see GameGraph
+    """
+
+    def __init__(self, game: CoopGame, leverage_epsilon: Value = 0):
+        types = game.player_types()
+        if types is None:
+            raise ValueError(f'{type(game).__name__} does not declare player types')
+        assert game.players_amount < 64, 'coalitions are held in int64 bitmasks'
+        self.game = game
+        self.leverage_epsilon = leverage_epsilon
+        self.types = [sorted(players) for players in types]
+        self.sizes = np.array([len(players) for players in self.types])
+        # state rows are the count vectors in mixed radix, row 0 is the empty coalition and is never a state
+        self.strides = np.cumprod(np.concatenate([[1], self.sizes[:-1] + 1]))
+        rows = np.arange(int(np.prod(self.sizes + 1)))
+        self.counts = rows[:, None] // self.strides % (self.sizes + 1)
+        self.totals = self.counts.sum(axis=1)
+        self.masks = self._canonical_masks(self.counts)
+        self.game_values = game.values(self.masks)
+        self.payoffs = np.zeros((len(rows), len(self.types)))
+        self.values = np.zeros(len(rows))
+        self._make_lattice()
+
+    def _canonical_masks(self, counts: np.ndarray) -> np.ndarray:
+        # the coalition of the first players of every type
+        masks = np.zeros(len(counts), dtype=np.int64)
+        for t, players in enumerate(self.types):
+            prefixes = np.array([coalition_to_mask(players[:amount]) for amount in range(len(players) + 1)],
+                                dtype=np.int64)
+            masks |= prefixes[counts[:, t]]
+        return masks
+
+    def row(self, counts: Iterable[int]) -> int:
+        return int(np.dot(list(counts), self.strides))
+
+    def counts_of(self, coalition: Coalition) -> Counts:
+        return tuple(len(coalition & set(players)) for players in self.types)
+
+    def states(self) -> List[Counts]:
+        return [tuple(counts) for counts in self.counts[1:].tolist()]
+
+    def __len__(self) -> int:
+        return len(self.counts) - 1
+
+    def shapely_values(self, row: int) -> np.ndarray:
+        """
+        the shapely value of a player of every type in the coalitions of the given row.
+        the subsets of the coalition are grouped by their counts and weighted by their exact amount of orderings,
+        as in CoopGame.type_shapely_values, so it is the same float the game gives
+        """
+        counts = self.counts[row]
+        payoff = np.zeros(len(self.types))
+        box = np.flatnonzero((self.counts <= counts).all(axis=1))
+        combs = math.factorial(int(counts.sum()))
+        for t in np.flatnonzero(counts):
+            without = box[self.counts[box, t] < counts[t]]
+            orderings = counted_orderings(counts, self.counts[without], t)
+            added = (self.game_values[without + self.strides[t]] - self.game_values[without]).tolist()
+            total = sum(Fraction(value) * amount for value, amount in zip(added, orderings) if value)
+            payoff[t] = float(total / combs)
+        return payoff
+
+    def _sub_payoff(self, current: int, row: int, payoff: np.ndarray) -> np.ndarray:
+        # GameGraph._sub_payoff per type, current is a superset of row
+        value = np.dot(self.counts[row], payoff)
+        non_existing = self.counts[current] - self.counts[row]
+        diff = value - self.values[current] + np.dot(non_existing, self.payoffs[current])
+        if diff < 0:
+            return payoff
+        normal = payoff if value == 0 else payoff / value
+        return np.where(self.counts[row] > 0, self.payoffs[current] + normal * diff, 0)
+
+    def loosely_dominates(self, row: int, other: int) -> bool:
+        # BaseNode.loosely_dominates between the canonical coalitions of two rows
+        high, low = self.payoffs[row].round(2), self.payoffs[other].round(2)
+        inside = np.minimum(self.counts[row], self.counts[other]) > 0
+        outside = self.counts[row] > self.counts[other]
+        if (inside & (high < low)).any() or (outside & (high < 0)).any():
+            return False
+        return bool((inside & (high > low)).any() or (outside & (high > 0)).any())
+
+    def _make_lattice(self):
+        # GameGraph._make_lattice over count vectors: the parents S + p of a state are grouped by the type of p,
+        # all k_t - c_t of a type contribute the same payoff so each type is weighted by their amount
+        root = len(self.counts) - 1
+        self.payoffs[root] = self.shapely_values(root)
+        self.values[root] = np.dot(self.counts[root], self.payoffs[root])
+        best = np.zeros(len(self.counts), dtype=int)
+        best[root] = root
+        for row in np.argsort(-self.totals, kind='stable')[1:]:
+            if self.totals[row] == 0:
+                continue
+            counts = self.counts[row]
+            shapely = self.shapely_values(row)
+            parent_types = np.flatnonzero(counts < self.sizes)
+            weights = self.sizes[parent_types] - counts[parent_types]
+            payoff = np.zeros(len(self.types))
+            for t, weight in zip(parent_types, weights):
+                payoff += weight * self._sub_payoff(best[row + self.strides[t]], row, shapely)
+            self.payoffs[row] = payoff / weights.sum()
+            self.values[row] = np.dot(counts, self.payoffs[row])
+            current = row
+            for t in parent_types:
+                parent_best = best[row + self.strides[t]]
+                if self.loosely_dominates(parent_best, current):
+                    current = parent_best
+            best[row] = current
+
+    def expand(self, coalition: Coalition) -> Payoff:
+        # the per player payoff of a coalition
+        payoff = np.zeros(self.game.players_amount)
+        row_payoff = self.payoffs[self.row(self.counts_of(coalition))]
+        for t, players in enumerate(self.types):
+            for player in coalition & set(players):
+                payoff[player] = row_payoff[t]
+        return payoff
+
+    def expand_matrix(self, masks: np.ndarray) -> np.ndarray:
+        # the per player payoffs of an array of coalition bitmasks, one row per mask
+        payoffs = np.zeros((len(masks), self.game.players_amount))
+        rows = np.zeros(len(masks), dtype=int)
+        for t, players in enumerate(self.types):
+            rows += ((masks[:, None] >> np.array(players, dtype=np.int64)) & 1).sum(axis=1) * self.strides[t]
+        for t, players in enumerate(self.types):
+            payoffs[:, players] = (self.payoffs[rows, t][:, None] *
+                                   ((masks[:, None] >> np.array(players, dtype=np.int64)) & 1))
+        return payoffs
+
+    def min_threats(self, payoffs: np.ndarray, row: int) -> np.ndarray:
+        """
+        threats.min_threats for the quotient: result[a, b] is the minimal threat a player of type a has over
+        a player of type b in the given row, nan if there is none.
+        the threat through a state i only depends on the counts of i and on whether the opponent is in it. the
+        rows i, j of the full graph are enumerated through their counts and the amount of players they share
+        with the state and with each other, taking for every count vector the most favourable feasible overlap
+        """
+        counts, sizes = self.counts, self.sizes
+        types_amount = len(self.types)
+        state = payoffs[row]
+        here = counts[row]
+        eye = np.eye(types_amount, dtype=int)
+        result = np.full((types_amount, types_amount), np.nan)
+        for b in np.flatnonzero(here):
+            for a in np.flatnonzero(here):
+                if a == b and here[a] < 2:
+                    continue
+                best = np.inf
+                for with_opponent in (True, False):
+                    need = eye[a] + with_opponent * eye[b]
+                    # the amount of players i shares with the state, per type, lies between low and high
+                    low = np.maximum(counts - (sizes - here), need)
+                    high = np.minimum(counts, here - (not with_opponent) * eye[b])
+                    feasible = (counts >= need).all(axis=1) & (low <= high).all(axis=1)
+                    gain = payoffs[:, a] - state[a]
+                    losses = ((low - with_opponent * eye[b]) * np.maximum(state - payoffs, 0)).sum(axis=1)
+                    opponent_payoff = payoffs[:, b] if with_opponent else np.zeros(len(counts))
+                    threat = state[b] - opponent_payoff - self.leverage_epsilon
+                    credible = feasible & (gain >= 0) & (losses <= gain) & (threat > 0)
+                    if with_opponent and (low[row] == here).all():
+                        credible[row] = False  # the only coalition with these counts is the state itself
+                    candidates = np.flatnonzero(credible)
+                    step = max(1, BLOCK_ELEMENTS // (len(counts) * types_amount))
+                    for start in range(0, len(candidates), step):
+                        i = candidates[start:start + step]
+                        op_remain = self._op_remain(payoffs, i, a, b, with_opponent, gain[i], opponent_payoff[i])
+                        final = np.minimum(threat[i], threat[i] - op_remain.max(axis=1))
+                        final = final[final > 0]
+                        if len(final):
+                            best = min(best, final.min())
+                if best != np.inf:
+                    result[a, b] = best
+        return result
+
+    def _op_remain(self, payoffs: np.ndarray, i: np.ndarray, a: int, b: int, with_opponent: bool,
+                   player_marginal: np.ndarray, opponent_payoff: np.ndarray) -> np.ndarray:
+        # [i, j] is the largest op_remain of LeverageGraph.threat_states over the coalitions with the counts of
+        # row j holding the opponent and not the player, -inf when there is none
+        counts, sizes = self.counts, self.sizes
+        eye = np.eye(len(self.types), dtype=int)
+        ours = counts[i][:, None, :]
+        theirs = counts[None, :, :]
+        # w players of every type are shared between i and j, the players of i except the player can be shared,
+        # the opponent is in both or only in j
+        low = np.maximum(with_opponent * eye[b], theirs - (sizes - ours))
+        high = np.minimum(ours - eye[a], theirs - (not with_opponent) * eye[b])
+        possible = (low <= high).all(axis=2)
+        preference = payoffs[i][:, None, :] - payoffs[None, :, :]
+        shared = np.where(preference > 0, low, high)
+        overlapping = (shared * preference).sum(axis=2)
+        # at least one shared player is needed for the overlapping case
+        single = np.where(high >= 1, preference, np.inf).min(axis=2)
+        overlapping = np.where(shared.sum(axis=2) == 0, single, overlapping)
+        their_opponent = payoffs[None, :, b]
+        opponent_payoff = opponent_payoff[:, None]
+        player_marginal = player_marginal[:, None]
+        op_remain = their_opponent - opponent_payoff - (overlapping + player_marginal)
+        separate = their_opponent - opponent_payoff - np.maximum(
+            player_marginal - self.values[None, :] + opponent_payoff, 0)
+        op_remain = np.where((low == 0).all(axis=2), np.maximum(op_remain, separate), op_remain)
+        return np.where(possible, op_remain, -np.inf)
+
+    def _leverage_row(self, payoffs: np.ndarray, row: int) -> np.ndarray:
+        # LeverageGraph._leverage_vector and _apply_leverage per type
+        here = self.counts[row]
+        payoff = payoffs[row].copy()
+        if here.sum() <= 1:
+            return payoff
+        threats = self.min_threats(payoffs, row)
+        present = np.flatnonzero(here)
+        # pay[a, b] is what a player of type a pays each player of type b
+        pay = np.zeros((len(self.types), len(self.types)))
+        for a in present:
+            for b in present:
+                over_b, over_a = threats[a, b], threats[b, a]
+                if np.isnan(over_b):
+                    continue
+                if np.isnan(over_a):
+                    pay[b, a] = over_b
+                else:
+                    pay[b, a] = LeverageGraph.handle_double_leverage([over_b], [over_a])[0]
+        # the amount of other players of every type each player of a type sees in the state
+        others = here[None, :] - np.eye(len(self.types), dtype=int)
+        max_pay = np.where(others > 0, pay, 0).max(axis=1)
+        totals = (others * pay).sum(axis=1)
+        normal = pay / np.where(totals == 0, 1, totals)[:, None]
+        for a in present:
+            payoff += others[:, a] * normal[a] * max_pay[a]
+            payoff[a] -= max_pay[a]
+        return np.where(here > 0, payoff, 0)
+
+    def with_payoffs(self, payoffs: np.ndarray) -> 'QuotientGraph':
+        new_graph = copy.copy(self)
+        new_graph.payoffs = payoffs
+        return new_graph
+
+    def evaluate_leverage(self) -> 'QuotientGraph':
+        payoffs = self.payoffs.copy()
+        for row in range(1, len(self.counts)):
+            payoffs[row] = self._leverage_row(self.payoffs, row)
+        return self.with_payoffs(payoffs)
+
+    def find_stable(self, max_iter=10) -> Tuple['QuotientGraph', int]:
+        current = self
+        for i in range(max_iter):
+            new_graph = current.evaluate_leverage()
+            if (new_graph.payoffs.round(2) + 0.0 == current.payoffs.round(2) + 0.0).all():
+                return new_graph, i
+            current = new_graph
+        return current, -1
+
+    def _dominated(self, strict: bool) -> np.ndarray:
+        """
+        rows dominated by some coalition overlapping one of their coalitions. by symmetry either every coalition
+        of a row is dominated or none is. for every pair of count vectors the players x of the dominating one
+        are split per type into w shared with the dominated coalition and x - w outside it, it dominates if some
+        split with at least one shared player satisfies the comparisons of BaseNode
+        """
+        counts, sizes = self.counts, self.sizes
+        round_payoffs = self.payoffs.round(2)
+        dominated = np.zeros(len(counts), dtype=bool)
+        everyone = np.arange(1, len(counts))
+        step = max(1, BLOCK_ELEMENTS // (len(counts) * len(self.types)))
+        for start in range(0, len(everyone), step):
+            x = everyone[start:start + step]
+            ours = counts[x][:, None, :]
+            theirs = counts[None, everyone, :]
+            high = round_payoffs[x][:, None, :]
+            low = round_payoffs[None, everyone, :]
+            lowest = np.maximum(0, ours - (sizes - theirs))
+            highest = np.minimum(ours, theirs)
+            over, positive = (high > low, high > 0) if strict else (high >= low, high >= 0)
+            # the allowed amounts of shared players of every type
+            low_shared = np.where(positive | (ours == 0), lowest, ours)
+            high_shared = np.where(over, highest, 0)
+            allowed = (low_shared <= high_shared).all(axis=2)
+            overlap = high_shared >= 1
+            if strict:
+                result = allowed & overlap.any(axis=2)
+            else:
+                preferred_inside = ((high > low) & overlap).any(axis=2)
+                outside = (high > 0) & (low_shared <= ours - 1)
+                other_overlap = overlap.sum(axis=2)[:, :, None] - overlap >= 1
+                both = np.maximum(low_shared, 1) <= np.minimum(high_shared, ours - 1)
+                result = allowed & (preferred_inside | (outside & (other_overlap | both)).any(axis=2))
+            dominated[everyone] |= result.any(axis=0)
+        return dominated
+
+    def strictly_dominant_set(self) -> Set[Counts]:
+        dominated = self._dominated(True)
+        return {tuple(self.counts[row]) for row in range(1, len(self.counts)) if not dominated[row]}
+
+    def loosely_dominant_set(self) -> Set[Counts]:
+        dominated = self._dominated(False)
+        return {tuple(self.counts[row]) for row in range(1, len(self.counts)) if not dominated[row]}
+
+    def canonical_mask(self, counts: Iterable[int]) -> Mask:
+        return int(self.masks[self.row(counts)])
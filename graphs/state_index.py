@@ -0,0 +1,42 @@
+import hashlib
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from graphs.dominance import members_matrix, DominanceIndex
+
+
+class StateIndex:
+    # the states of a graph as matrices, one row per state in increasing coalition bitmask order
+    def __init__(self, graph):
+        self.states: Optional[List] = sorted(graph.to_set(), key=lambda state: state.mask)
+        self.masks = np.array([state.mask for state in self.states], dtype=np.int64)
+        self.members = members_matrix(self.masks, graph.game.players_amount)
+        self.payoffs = graph.payoff_matrix(self.states)
+        self.values = np.array([state.value for state in self.states], dtype=float)
+        self.rows: Optional[Dict] = {state: row for row, state in enumerate(self.states)}
+        # graphs built without merge_same_coalition hold several states per coalition
+        self.unique = len(np.unique(self.masks)) == len(self.masks)
+        self._dominance: Optional[DominanceIndex] = None
+
+    def __getstate__(self):
+        # worker processes get the matrices only, not the nodes of the graph
+        state = self.__dict__.copy()
+        state.update(states=None, rows=None, payoffs=None, _dominance=None)
+        return state
+
+    @property
+    def dominance(self) -> DominanceIndex:
+        # built on first use, a graph whose payoffs change gets a new state index and with it a new dominance index
+        if self._dominance is None:
+            self._dominance = DominanceIndex(self.payoffs, self.masks)
+        return self._dominance
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def fingerprint(self, payoffs: np.ndarray) -> bytes:
+        # equal for two payoff matrices exactly when GameGraph.__eq__ would find their graphs equal,
+        # adding 0.0 turns -0.0 into 0.0 so both zeros hash the same
+        round_payoffs = payoffs.round(2)[self.members] + 0.0
+        return hashlib.blake2b(round_payoffs.tobytes(), digest_size=16).digest()
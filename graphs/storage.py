@@ -0,0 +1,109 @@
+import importlib
+import json
+import struct
+
+import numpy as np
+
+from games.coop_game import CoopGame
+from graphs.game_graph import GameGraph
+
+MAGIC = b'LVGRAPH1'
+# offset alignment of the arrays in the file
+ALIGNMENT = 64
+
+
+def _class_path(cls) -> str:
+    return f'{cls.__module__}.{cls.__qualname__}'
+
+
+def _load_class(path: str, base: type) -> type:
+    # the class a header names, which must derive from base, so a crafted file cannot call anything else
+    module, name = path.rsplit('.', 1)
+    cls = getattr(importlib.import_module(module), name, None)
+    if not (isinstance(cls, type) and issubclass(cls, base)):
+        raise ValueError(f'{path} is not a {base.__name__}')
+    return cls
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_graph(graph, path: str):
+    """
+    writes a graph in the dense layout of a compact graph: a json header with the classes and parameters of the
+    graph and the game, then the payoff matrix and the value vector, both indexed by coalition bitmask and
+    little endian float64, each starting at a multiple of ALIGNMENT so load_graph can map them with numpy.memmap
+    """
+    payoffs, values = graph.dense_arrays()
+    parameters = graph.game.parameters()
+    header = {
+        'graph': _class_path(type(graph)),
+        'game': _class_path(type(graph.game)),
+        # None for games that do not describe their parameters
+        'args': None if parameters is None else list(parameters[0]),
+        'kwargs': None if parameters is None else parameters[1],
+        'coalition': sorted(graph.coalition),
+        'players_amount': graph.game.players_amount,
+        'attributes': {'parent_average': graph.parent_average},
+    }
+    if hasattr(graph, 'leverage_epsilon'):
+        header['attributes']['leverage_epsilon'] = graph.leverage_epsilon
+    start = _aligned(len(MAGIC) + 8 + 1024)
+    arrays = {}
+    offset = start
+    for name, array in (('payoffs', payoffs), ('values', values)):
+        arrays[name] = {'offset': offset, 'shape': list(array.shape)}
+        offset = _aligned(offset + array.size * 8)
+    header['arrays'] = arrays
+    encoded = json.dumps(header, default=lambda value: value.item()).encode()
+    if len(MAGIC) + 8 + len(encoded) > start:
+        # a header that does not fit the reserved space pushes the arrays forward
+        shift = _aligned(len(MAGIC) + 8 + len(encoded)) - start
+        for description in arrays.values():
+            description['offset'] += shift
+        encoded = json.dumps(header, default=lambda value: value.item()).encode()
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(encoded)))
+        file.write(encoded)
+        for name, array in (('payoffs', payoffs), ('values', values)):
+            file.seek(arrays[name]['offset'])
+            file.write(np.ascontiguousarray(array, dtype='<f8').tobytes())
+
+
+def read_header(path: str) -> dict:
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a saved graph')
+        length, = struct.unpack('<Q', file.read(8))
+        return json.loads(file.read(length))
+
+
+def load_graph(path: str, mode='r', game=None):
+    """
+    the graph saved in path as a compact graph whose payoffs and values are mapped from the file, so processes
+    loading the same file share its pages. with mode 'r' they are read only, any leverage pass still works since
+    it copies the graph first. mode 'c' maps them copy on write, mode None reads them into memory.
+    the game is constructed again from the saved parameters unless it is given, which it must be for games saved
+    without them
+    """
+    header = read_header(path)
+    if game is None:
+        if header['args'] is None:
+            raise ValueError(f'{path} holds a {header["game"]} saved without its parameters, pass the game to load it')
+        game = _load_class(header['game'], CoopGame)(*header['args'], **header['kwargs'])
+    elif game.players_amount != header['players_amount']:
+        raise ValueError(f'{path} was saved for {header["players_amount"]} players, not {game.players_amount}')
+    arrays = []
+    for name in ('payoffs', 'values'):
+        description = header['arrays'][name]
+        shape = tuple(description['shape'])
+        if mode is None:
+            with open(path, 'rb') as file:
+                file.seek(description['offset'])
+                arrays.append(np.fromfile(file, dtype='<f8', count=int(np.prod(shape))).reshape(shape))
+        else:
+            arrays.append(np.memmap(path, dtype='<f8', mode=mode, offset=description['offset'], shape=shape))
+    graph_class = _load_class(header['graph'], GameGraph)
+    return graph_class(game, set(header['coalition']), arrays=tuple(arrays), **header['attributes'])
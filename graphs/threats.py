@@ -0,0 +1,125 @@
+import numpy as np
+
+import instrumentation
+
+from _types import Value
+from graphs.dominance import BLOCK_ELEMENTS
+from graphs.state_index import StateIndex
+
+
+def _ordered_sum(terms: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    # sums terms[..., x] where mask[..., x] one player at a time in increasing player order,
+    # which is the order LeverageGraph.threat_states adds them in, so the floats come out the same
+    total = np.zeros(terms.shape[:-1])
+    for x in range(terms.shape[-1]):
+        total += np.where(mask[..., x], terms[..., x], 0)
+    return total
+
+
+def min_threats(index: StateIndex, payoffs: np.ndarray, row: int, leverage_epsilon: Value) -> np.ndarray:
+    """
+    the minimal threat of every player over every other player of the state in the given row,
+    computed over the whole payoff matrix (rows aligned with the index) at once.
+    result[player, opponent] is the first value LeverageGraph.leverages(state, player, opponent) returns,
+    or nan when player has no threat over opponent
+    """
+    values, members, masks = index.values, index.members, index.masks
+    players_amount = payoffs.shape[1]
+    state = payoffs[row]
+    players = np.flatnonzero(members[row])
+    result = np.full((players_amount, players_amount), np.nan)
+    for opponent in players:
+        # losses of the players whose agreement is needed in order to switch from the state to each row
+        needed = members & members[row]
+        needed[:, opponent] = False
+        losses = _ordered_sum(np.maximum(state - payoffs, 0), needed)
+        for player in players:
+            if player == opponent:
+                continue
+            gain = payoffs[:, player] - state[player]
+            credible = members[:, player] & (payoffs[:, player] >= state[player]) & (losses <= gain)
+            credible[row] = False
+            threat = state[opponent] - payoffs[:, opponent] - leverage_epsilon
+            candidates = np.flatnonzero(credible & (threat > 0))
+            if len(candidates) == 0:
+                continue
+            without = np.flatnonzero(members[:, opponent] & ~members[:, player])
+            best = np.inf
+            step = max(1, BLOCK_ELEMENTS // max(1, len(without) * players_amount))
+            for start in range(0, len(candidates), step):
+                i = candidates[start:start + step]
+                j = without
+                instrumentation.count('threat_state_evaluations', len(i) * len(j))
+                player_marginal = gain[i][:, None]
+                overlap_members = members[i][:, None, :] & members[j][None, :, :]
+                overlapping = _ordered_sum(payoffs[i][:, None, :] - payoffs[j][None, :, :], overlap_members) + \
+                    player_marginal
+                separate = np.maximum(player_marginal - values[j][None, :] + payoffs[i, opponent][:, None], 0)
+                accumulated = np.where(masks[i][:, None] & masks[j][None, :] != 0, overlapping, separate)
+                op_remain = payoffs[j, opponent][None, :] - payoffs[i, opponent][:, None] - accumulated
+                init_threat = threat[i]
+                final = np.minimum(init_threat, (init_threat[:, None] - op_remain).min(axis=1, initial=np.inf))
+                final = final[final > 0]
+                if len(final):
+                    best = min(best, final.min())
+            if best != np.inf:
+                result[player, opponent] = best
+    return result
+
+
+def batch_min_threats(members: np.ndarray, masks: np.ndarray, values: np.ndarray, payoffs: np.ndarray, row: int,
+                      leverage_epsilon: Value) -> np.ndarray:
+    """
+    min_threats of the state in the given row for a batch of games sharing the same states, payoffs is
+    (games, states, players) and values is (games, states). result[game] is the min_threats matrix of that game,
+    every entry computed with the same floating point operations
+    """
+    games, _, players_amount = payoffs.shape
+    state = payoffs[:, row]
+    players = np.flatnonzero(members[row])
+    result = np.full((games, players_amount, players_amount), np.nan)
+    for opponent in players:
+        needed = members & members[row]
+        needed[:, opponent] = False
+        losses = _ordered_sum(np.maximum(state[:, None, :] - payoffs, 0), needed)
+        for player in players:
+            if player == opponent:
+                continue
+            gain = payoffs[:, :, player] - state[:, None, player]
+            credible = members[:, player] & (payoffs[:, :, player] >= state[:, None, player]) & (losses <= gain)
+            credible[:, row] = False
+            threat = state[:, None, opponent] - payoffs[:, :, opponent] - leverage_epsilon
+            candidate = credible & (threat > 0)
+            # the rows that are a candidate in any game, the other games mask them out
+            candidates = np.flatnonzero(candidate.any(axis=0))
+            if len(candidates) == 0:
+                continue
+            j = np.flatnonzero(members[:, opponent] & ~members[:, player])
+            with_candidates = np.flatnonzero(candidate.any(axis=1))
+            best = np.full(games, np.inf)
+            # blocks of candidate rows as in min_threats, then blocks of games, so no temporary holds more than
+            # BLOCK_ELEMENTS whatever the size of the batch
+            row_step = max(1, BLOCK_ELEMENTS // max(1, len(j) * players_amount))
+            for row_start in range(0, len(candidates), row_step):
+                i = candidates[row_start:row_start + row_step]
+                overlap_members = members[i][:, None, :] & members[j][None, :, :]
+                overlaps = masks[i][:, None] & masks[j][None, :] != 0
+                step = max(1, BLOCK_ELEMENTS // max(1, len(i) * len(j) * players_amount))
+                for start in range(0, len(with_candidates), step):
+                    g = with_candidates[start:start + step]
+                    instrumentation.count('threat_state_evaluations', len(g) * len(i) * len(j))
+                    i_payoffs, j_payoffs = payoffs[g[:, None], i], payoffs[g[:, None], j]
+                    player_marginal = gain[g[:, None], i][:, :, None]
+                    overlapping = _ordered_sum(i_payoffs[:, :, None, :] - j_payoffs[:, None, :, :],
+                                               overlap_members) + player_marginal
+                    separate = np.maximum(player_marginal - values[g[:, None], j][:, None, :] +
+                                          i_payoffs[:, :, opponent, None], 0)
+                    accumulated = np.where(overlaps, overlapping, separate)
+                    op_remain = j_payoffs[:, None, :, opponent] - i_payoffs[:, :, opponent, None] - accumulated
+                    init_threat = threat[g[:, None], i]
+                    final = np.minimum(init_threat, (init_threat[:, :, None] - op_remain).min(axis=2, initial=np.inf))
+                    final = np.where(candidate[g[:, None], i] & (final > 0), final, np.inf)
+                    best[g] = np.minimum(best[g], final.min(axis=1))
+            found = best != np.inf
+            result[found, player, opponent] = best[found]
+    return result
@@ -0,0 +1,90 @@
+# counters and phase timers for the game, graph and leverage code. nothing is recorded unless a Recorder is active:
+#
+#     with Recorder(callback=print) as recorder:
+#         tree.find_stable()
+#     recorder.report()
+#
+# the hooks cost a global lookup while no recorder is active. work done by the worker processes of a LeveragePool
+# is not counted, only the time of the passes they run
+import contextlib
+import time
+from collections import Counter
+from typing import Optional, Callable, Dict, Any, List
+
+# the recorder that receives the hooks, None when instrumentation is off
+_active: Optional['Recorder'] = None
+_off = contextlib.nullcontext()
+
+
+class _Phase:
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder: 'Recorder', name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.recorder.seconds[self.name] += time.perf_counter() - self.start
+        self.recorder.calls[self.name] += 1
+
+
+class Recorder:
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+        # callback gets every entry of iterations as soon as it is recorded
+        self.callback = callback
+        self.counters: Counter = Counter()
+        self.seconds: Counter = Counter()
+        self.calls: Counter = Counter()
+        self.iterations: List[Dict[str, Any]] = []
+        self._mark = self._snapshot()
+        self._previous: Optional[Recorder] = None
+
+    def _snapshot(self):
+        return self.counters.copy(), self.seconds.copy(), self.calls.copy(), time.perf_counter()
+
+    def iteration(self, **info):
+        # closes an iteration of a leverage loop, with what was counted and timed since the previous one
+        counters, seconds, calls, start = self._mark
+        self._mark = self._snapshot()
+        entry = dict(info, seconds=self._mark[3] - start, counters=dict(self.counters - counters),
+                     phases={name: {'seconds': self.seconds[name] - seconds[name],
+                                    'calls': self.calls[name] - calls[name]}
+                             for name in self.calls if self.calls[name] != calls[name]})
+        self.iterations.append(entry)
+        if self.callback is not None:
+            self.callback(entry)
+
+    def report(self) -> Dict[str, Any]:
+        return {'counters': dict(self.counters),
+                'phases': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.calls},
+                'iterations': self.iterations}
+
+    def __enter__(self) -> 'Recorder':
+        global _active
+        self._previous, _active = _active, self
+        self._mark = self._snapshot()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = self._previous
+
+
+def count(name: str, amount: int = 1):
+    if _active is not None:
+        _active.counters[name] += amount
+
+
+def phase(name: str):
+    # times the block under name when a recorder is active
+    if _active is None:
+        return _off
+    return _Phase(_active, name)
+
+
+def iteration(**info):
+    if _active is not None:
+        _active.iteration(**info)
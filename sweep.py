@@ -0,0 +1,127 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple, Dict, Any, Set
+
+from games.boss_game import BossGame
+from games.boss_game_with_unemployment import BossGameWithUnemployment
+from games.cookie_game import CookieGame
+from games.coop_game import CoopGame
+from games.gloves_game import GlovesGame
+from games.pipeline_game import PipelineGame
+from games.shoes_game import ShoesGame
+from graphs.game_graph import GameGraph
+from graphs.leverage_graph import LeverageGraph
+from graphs.storage import load_graph
+
+GAMES = {game.__name__: game for game in (BossGame, BossGameWithUnemployment, CookieGame, GlovesGame, PipelineGame,
+                                          ShoesGame)}
+FIELDS = ['game', 'construction', 'epsilon', 'iterations', 'dominant', 'seconds']
+
+# the base lattices a worker process has loaded, by file
+_lattices: Dict[str, GameGraph] = {}
+
+
+def parse_game(spec: List[str]) -> Tuple[str, CoopGame]:
+    # ['PipelineGame', '4', '2', '3'] or ['CookieGame', '5', '3', 'value_factor=1.2']
+    name, *tokens = spec
+    args = [json.loads(token) for token in tokens if '=' not in token]
+    kwargs = {key: json.loads(value) for key, value in (token.split('=', 1) for token in tokens if '=' in token)}
+    label = f'{name}({", ".join([repr(x) for x in args] + [f"{k}={v!r}" for k, v in kwargs.items()])})'
+    return label, GAMES[name](*args, **kwargs)
+
+
+def construction(parent_average: bool) -> str:
+    # how the base graphs of a sweep are built, written into every result
+    return 'parent_average' if parent_average else 'tree'
+
+
+def finished_runs(path: str) -> Set[Tuple[str, str, float]]:
+    # the (game, construction, epsilon) runs already in an output file, so an interrupted sweep can be resumed.
+    # rows that do not name their construction are run again
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline='') as file:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(file))
+        else:
+            rows = [json.loads(line) for line in file if line.strip()]
+    return {(row['game'], row.get('construction'), float(row['epsilon'])) for row in rows}
+
+
+def run(lattice_path: str, label: str, built: str, epsilon: float, max_iter: int) -> Dict[str, Any]:
+    if lattice_path not in _lattices:
+        _lattices[lattice_path] = load_graph(lattice_path)
+    graph = LeverageGraph.from_graph(_lattices[lattice_path], epsilon)
+    start = time.perf_counter()
+    stable, iterations = graph.find_stable(max_iter)
+    dominant = sorted([sorted(state.coalition), [float(x) for x in state.round_payoff[sorted(state.coalition)]]]
+                      for state in stable.strictly_dominant_set())
+    return {'game': label, 'construction': built, 'epsilon': epsilon, 'iterations': iterations, 'dominant': dominant,
+            'seconds': round(time.perf_counter() - start, 3)}
+
+
+def write_result(file, result: Dict[str, Any], as_csv: bool):
+    if as_csv:
+        csv.DictWriter(file, FIELDS).writerow(dict(result, dominant=json.dumps(result['dominant'])))
+    else:
+        file.write(json.dumps(result) + '\n')
+    file.flush()
+
+
+def sweep(games: List[Tuple[str, CoopGame]], epsilons: List[float], out: str, workers=1, max_iter=10,
+          lattice_dir=None, parent_average=False):
+    """
+    runs find_stable for every game and epsilon. every game's graph is built once, as the merged tree or with
+    parent_average when it is given, and saved to lattice_dir (a temporary directory by default), the workers map
+    it from there and only redo the leverage passes. results are appended to out (json lines, or csv when it ends
+    with .csv) as they finish with the construction they were built with, runs already in out are skipped.
+    a graph already in lattice_dir is loaded instead of built again
+    """
+    built = construction(parent_average)
+    done = finished_runs(out)
+    as_csv = out.endswith('.csv')
+    with tempfile.TemporaryDirectory() as temporary, open(out, 'a', newline='') as file:
+        if as_csv and not done and file.tell() == 0:
+            csv.DictWriter(file, FIELDS).writeheader()
+        lattice_dir = lattice_dir or temporary
+        os.makedirs(lattice_dir, exist_ok=True)
+        with ProcessPoolExecutor(workers) as executor:
+            futures = []
+            for label, game in games:
+                todo = [epsilon for epsilon in epsilons if (label, built, float(epsilon)) not in done]
+                if not todo:
+                    continue
+                lattice_path = os.path.join(lattice_dir, f'{label}.{built}.lvg')
+                if not os.path.exists(lattice_path):
+                    GameGraph(game, compact=True, parent_average=parent_average).save(lattice_path)
+                futures += [executor.submit(run, lattice_path, label, built, epsilon, max_iter) for epsilon in todo]
+            for future in as_completed(futures):
+                result = future.result()
+                write_result(file, result, as_csv)
+                print(f'{result["game"]} {result["construction"]} epsilon={result["epsilon"]}: {result["iterations"]} '
+                      f'({result["seconds"]}s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='find_stable over a grid of games and leverage epsilons')
+    parser.add_argument('--game', nargs='+', action='append', required=True, metavar='ARG',
+                        help='a game class and its arguments, e.g. --game PipelineGame 4 2 3')
+    parser.add_argument('--epsilon', nargs='+', type=float, default=[0.0])
+    parser.add_argument('--out', default='sweep.jsonl', help='results file, .jsonl or .csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-iter', type=int, default=10)
+    parser.add_argument('--lattice-dir', help='keep the built graphs here for later sweeps')
+    parser.add_argument('--parent-average', '--lattice', action='store_true',
+                        help='build every state from the average of its parents instead of the merged tree')
+    args = parser.parse_args()
+    sweep([parse_game(spec) for spec in args.game], args.epsilon, args.out, args.workers, args.max_iter,
+          args.lattice_dir, args.parent_average)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,10 @@
-from _types import Payoff
+import math
+from fractions import Fraction
+from typing import List
+
+import numpy as np
+
+from _types import Coalition, Mask, Payoff
 
 
 def normalize_payoff(payoff: Payoff) -> Payoff:
@@ -6,3 +12,75 @@ def normalize_payoff(payoff: Payoff) -> Payoff:
     if s == 0:
         return payoff
     return payoff / s
+
+
+def coalition_to_mask(coalition: Coalition) -> Mask:
+    mask = 0
+    for player in coalition:
+        mask |= 1 << player
+    return mask
+
+
+def mask_to_coalition(mask: Mask) -> Coalition:
+    coalition = set()
+    player = 0
+    while mask:
+        if mask & 1:
+            coalition.add(player)
+        mask >>= 1
+        player += 1
+    return coalition
+
+
+def popcount(mask: Mask) -> int:
+    return bin(mask).count('1')
+
+
+def submasks(mask: Mask):
+    # every subset of mask, from mask itself down to the empty coalition
+    sub = mask
+    while True:
+        yield sub
+        if sub == 0:
+            return
+        sub = (sub - 1) & mask
+
+
+def exact_sum(values: List[float]) -> Fraction:
+    # the sum of floats without rounding: math.fsum rounds it once, and what that rounding dropped is summed again
+    # until nothing is left
+    total = Fraction(0)
+    values = list(values)
+    while True:
+        part = math.fsum(values)
+        if part == 0:
+            return total
+        total += Fraction(part)
+        values.append(-part)
+
+
+def popcounts(masks: np.ndarray) -> np.ndarray:
+    # amount of players in each coalition of an array of bitmasks
+    masks = masks.astype(np.uint64)
+    masks = masks - ((masks >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    masks = (masks & np.uint64(0x3333333333333333)) + ((masks >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    masks = (masks + (masks >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+    return ((masks * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def counted_orderings(counts: np.ndarray, sub_counts: np.ndarray, player_type: int) -> List[int]:
+    """
+    the weight of a group of subsets in the shapely value of a player of the given type times |c|!, as exact
+    integers. the coalition holds counts[u] players of every type u and the subsets hold sub_counts[:, u] of them
+    (sub_counts[:, player_type] is below counts[player_type]): the amount of such subsets without the player
+    times |s|! (|c| - |s| - 1)!
+    """
+    size = int(counts.sum())
+    available = counts.tolist()
+    available[player_type] -= 1
+    orderings = []
+    for sub in sub_counts.tolist():
+        chosen = sum(sub)
+        ways = math.prod(math.comb(a, b) for a, b in zip(available, sub))
+        orderings.append(ways * math.factorial(chosen) * math.factorial(size - chosen - 1))
+    return orderings